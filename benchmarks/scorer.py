@@ -0,0 +1,83 @@
+# ---------------------------------------------------------------
+# Benchmark of score_by_entity on a synthetic corpus of 100k sentences. The previous matching of the
+# entities as lists of dicts is quadratic, it is timed on the first sentences only
+# python benchmarks/scorer.py --sentences 100000 --baseline_sentences 2000
+# ---------------------------------------------------------------
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from cdeid.utils.scorer import decode_from_bio2, score_by_entity  # noqa: E402
+
+PHI_TYPES = ['NAME', 'DATE', 'PHONE', 'ADDRESS', 'IDN']
+
+
+# the fp and fn of the previous score_by_entity
+def match_lists(pred_tag_sequences, gold_tag_sequences):
+    def decode_all(tag_sequences):
+        ents = []
+        for sent_id, tags in enumerate(tag_sequences):
+            for ent in decode_from_bio2(tags):
+                ent['sent_id'] = sent_id
+                ents += [ent]
+        return ents
+
+    gold_ents = decode_all(gold_tag_sequences)
+    pred_ents = decode_all(pred_tag_sequences)
+    fp = [p for p in pred_ents if p not in gold_ents]
+    fn = [g for g in gold_ents if g not in pred_ents]
+    return fp, fn
+
+
+# gold sentences with an entity every 8 tokens on average, and predictions missing or changing some of them
+def synthetic_corpus(n_sentences, seed=2020):
+    rng = random.Random(seed)
+    gold = []
+    pred = []
+    for _ in range(n_sentences):
+        tags = []
+        n_tokens = rng.randint(5, 30)
+        while len(tags) < n_tokens:
+            if rng.random() < 0.125:
+                phi_type = rng.choice(PHI_TYPES)
+                tags += ['B-' + phi_type] + ['I-' + phi_type] * rng.randint(0, 2)
+            else:
+                tags.append('O')
+        gold.append(tags)
+        pred.append([('O' if rng.random() < 0.5 else 'B-' + rng.choice(PHI_TYPES)) if rng.random() < 0.05 else tag
+                     for tag in tags])
+    return pred, gold
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sentences', type=int, default=100000, help='the number of sentences of the corpus')
+    parser.add_argument('--baseline_sentences', type=int, default=2000,
+                        help='the number of sentences scored by both matchings')
+    options = parser.parse_args()
+
+    pred, gold = synthetic_corpus(options.sentences)
+    start_time = time.time()
+    precision, recall, f1, fp, fn = score_by_entity(pred, gold, verbose=False)
+    print('{} sentences: {:.3f} s, P {:.4f} R {:.4f} F1 {:.4f}, {} FP, {} FN'
+          .format(options.sentences, time.time() - start_time, precision, recall, f1, len(fp), len(fn)))
+
+    n = options.baseline_sentences
+    start_time = time.time()
+    _, _, _, fp, fn = score_by_entity(pred[:n], gold[:n], verbose=False)
+    hashed_seconds = time.time() - start_time
+    start_time = time.time()
+    fp_lists, fn_lists = match_lists(pred[:n], gold[:n])
+    lists_seconds = time.time() - start_time
+    if fp != fp_lists or fn != fn_lists:
+        raise Exception('The FP and FN of the matchings are different')
+    print('{} sentences: hashed {:.3f} s, lists {:.3f} s, speedup {:.1f}x'
+          .format(n, hashed_seconds, lists_seconds, lists_seconds / max(hashed_seconds, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
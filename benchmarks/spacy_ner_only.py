@@ -0,0 +1,68 @@
+# ---------------------------------------------------------------
+# Benchmark of a trained spacy model with the full pipeline and with only the ner component
+# python benchmarks/spacy_ner_only.py C:/workspace/models/model-best C:/data/test.bio
+# ---------------------------------------------------------------
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from cdeid.data.data_loader import load_doc  # noqa: E402
+from cdeid.models.ensemble_model import load_spacy, spacy_tags, tokenize_lines  # noqa: E402
+
+
+# load the model and predict the lines in this process, the peak RSS is the one of the process
+def run(model_path, data_file, ner_only, n_lines):
+    sents, _ = load_doc(data_file)
+    lines = [' '.join(sent) for sent in sents[:n_lines]]
+    start_time = time.time()
+    spacy_model = load_spacy(model_path, ner_only)
+    load_seconds = time.time() - start_time
+
+    docs_tokens = tokenize_lines(spacy_model, lines)
+    start_time = time.time()
+    tags = spacy_tags(spacy_model, docs_tokens)
+    predict_seconds = time.time() - start_time
+    return {'pipeline': spacy_model.pipe_names,
+            'load_seconds': load_seconds,
+            'ms_per_line': 1000 * predict_seconds / max(len(lines), 1),
+            'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'tags': tags}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model_path', type=str, help='the directory of a trained spacy model')
+    parser.add_argument('data_file', type=str, help='a BIO file whose sentences are predicted')
+    parser.add_argument('--lines', type=int, default=2000, help='the number of lines predicted')
+    parser.add_argument('--ner_only', type=int, choices=[0, 1], help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.ner_only is not None:
+        print(json.dumps(run(options.model_path, options.data_file, bool(options.ner_only), options.lines)))
+        return
+
+    # each pipeline runs in a new process so that the RSS of one does not include the other
+    results = {}
+    for ner_only in [0, 1]:
+        output = subprocess.run([sys.executable, __file__, options.model_path, options.data_file,
+                                 '--lines', str(options.lines), '--ner_only', str(ner_only)],
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        results[ner_only] = json.loads(output.splitlines()[-1])
+
+    for ner_only, result in results.items():
+        print('{:<30} load {:6.2f} s, {:7.3f} ms/line, max RSS {:8.1f} MB'
+              .format(','.join(result['pipeline']), result['load_seconds'], result['ms_per_line'],
+                      result['max_rss_mb']))
+    print('Speedup per line: {:.2f}x'.format(results[0]['ms_per_line'] / max(results[1]['ms_per_line'], 1e-9)))
+    print('RSS saved: {:.1f} MB'.format(results[0]['max_rss_mb'] - results[1]['max_rss_mb']))
+    print('Same predictions: {}'.format(results[0]['tags'] == results[1]['tags']))
+
+
+if __name__ == '__main__':
+    main()
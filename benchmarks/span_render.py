@@ -0,0 +1,65 @@
+# ---------------------------------------------------------------
+# Microbenchmark of the entity rendering on entity-dense synthetic lines, against the previous
+# rendering which copied the line once per entity
+# python benchmarks/span_render.py
+# ---------------------------------------------------------------
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from cdeid.deidentifier.annotator import type_tag  # noqa: E402
+from cdeid.utils.span_renderer import render_spans  # noqa: E402
+
+
+def render_copying(text, entities):
+    offset = 0
+    for entity in entities:
+        text = text[:entity[0] + offset] + '<**' + entity[2] + '**>' + text[entity[1] + offset:]
+        offset += (len(entity[2]) + 6 - (entity[1] - entity[0]))
+    return text
+
+
+# a line of n_words words, entity_rate of which are entities
+def synthetic_line(rng, n_words, entity_rate):
+    words = []
+    entities = []
+    start = 0
+    for _ in range(n_words):
+        word = ''.join(rng.choice('abcdefghij') for _ in range(rng.randint(2, 9)))
+        if rng.random() < entity_rate:
+            entities.append((start, start + len(word), rng.choice(['NAME', 'DATE', 'PHONE', 'ADDRESS'])))
+        words.append(word)
+        start += len(word) + 1
+    return ' '.join(words), entities
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=1000, help='the number of lines of each size')
+    parser.add_argument('--entity_rate', type=float, default=0.5, help='the proportion of words which are entities')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of timings, the best is reported')
+    options = parser.parse_args()
+
+    rng = random.Random(2020)
+    print('{:>8} {:>9} {:>12} {:>12} {:>8}'.format('words', 'entities', 'copying (s)', 'one pass (s)', 'speedup'))
+    for n_words in [20, 100, 500, 2000]:
+        lines = [synthetic_line(rng, n_words, options.entity_rate) for _ in range(options.lines)]
+        for text, entities in lines:
+            if render_spans(text, entities, type_tag) != render_copying(text, entities):
+                raise Exception('The renderings are different: {}'.format(text))
+
+        copying = min(timeit.repeat(lambda: [render_copying(text, entities) for text, entities in lines],
+                                    number=1, repeat=options.repeat))
+        one_pass = min(timeit.repeat(lambda: [render_spans(text, entities, type_tag) for text, entities in lines],
+                                     number=1, repeat=options.repeat))
+        n_entities = sum(len(entities) for _, entities in lines) / len(lines)
+        print('{:>8} {:>9.1f} {:>12.4f} {:>12.4f} {:>7.1f}x'.format(n_words, n_entities, copying, one_pass,
+                                                                   copying / one_pass))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# ---------------------------------------------------------------
+# Benchmark of the startup time of the command line and the package imports
+# The eager runs import the toolkits and load en_core_web_lg first, as the package did at import time
+# python benchmarks/startup.py --repeat 5
+# ---------------------------------------------------------------
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = str(Path(__file__).resolve().parents[1])
+
+COMMANDS = {
+    'cli start': "import runpy, sys; sys.argv = ['cdeid']\n"
+                 "try:\n    runpy.run_module('cdeid', run_name='__main__')\nexcept SystemExit:\n    pass",
+    '--help': "import runpy, sys; sys.argv = ['cdeid', '--help']\n"
+              "try:\n    runpy.run_module('cdeid', run_name='__main__')\nexcept SystemExit:\n    pass",
+    'train path': 'import cdeid.models.trainer',
+    'deid path': 'import cdeid.deidentifier.phi_deid',
+}
+
+EAGER_IMPORTS = "import spacy, stanza, flair.models; spacy.load('en_core_web_lg')\n"
+
+# the heavy modules loaded by a command
+LOADED_MODULES = "\nimport sys; print(','.join(sorted(m for m in ['spacy', 'stanza', 'flair', 'torch'] if m in sys.modules)))"
+
+
+# median seconds of a python process running the code, and the heavy modules it loaded
+def time_command(code, repeat):
+    seconds = []
+    output = None
+    for _ in range(repeat):
+        start_time = time.time()
+        result = subprocess.run([sys.executable, '-c', code + LOADED_MODULES], cwd=ROOT, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True)
+        seconds.append(time.time() - start_time)
+        if result.returncode != 0:
+            return None, None
+        output = result.stdout.splitlines()[-1] if result.stdout.strip() else ''
+    return statistics.median(seconds), output
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='the number of runs of each command')
+    parser.add_argument('--no_eager', action='store_true', help='do not measure the eager imports')
+    options = parser.parse_args()
+
+    print('{:<12} {:>10} {:>10} {:>8}  {}'.format('command', 'lazy (s)', 'eager (s)', 'speedup', 'loaded modules'))
+    for name, code in COMMANDS.items():
+        lazy_seconds, loaded = time_command(code, options.repeat)
+        if lazy_seconds is None:
+            print('{:<12} failed'.format(name))
+            continue
+        eager_seconds = None if options.no_eager else time_command(EAGER_IMPORTS + code, options.repeat)[0]
+        if eager_seconds is None:
+            print('{:<12} {:>10.3f} {:>10} {:>8}  {}'.format(name, lazy_seconds, '-', '-', loaded or 'none'))
+        else:
+            print('{:<12} {:>10.3f} {:>10.3f} {:>7.1f}x  {}'.format(name, lazy_seconds, eager_seconds,
+                                                                   eager_seconds / lazy_seconds, loaded or 'none'))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,36 @@
 import argparse
 import sys
 
-from cdeid.deidentifier.phi_deid import PHIDeid
+from cdeid.deidentifier.deid_server import serve
+from cdeid.deidentifier.phi_deid import PHIDeid, collect_deid_files
+from cdeid.models.ensemble_model import CASCADE_ORDER, VOTE_ORDER
+from cdeid.models.model_optimizer import optimize_models
 from cdeid.models.trainer import Trainer
 from cdeid.utils.resources import PACKAGE_NAME
 
 
+# a vote weight of a model, e.g. flair_imbalanced=2
+def vote_weight(value):
+    name, _, weight = value.partition('=')
+    if name not in VOTE_ORDER:
+        raise argparse.ArgumentTypeError('unknown model {}, the models are {}'.format(name, ', '.join(VOTE_ORDER)))
+    try:
+        weight = float(weight)
+    except ValueError:
+        weight = -1
+    if weight < 0:
+        raise argparse.ArgumentTypeError('invalid weight of {}: {}'.format(name, value.partition('=')[2]))
+    return name, weight
+
+
 def get_options(args=sys.argv[1:]):
     parser = argparse.ArgumentParser(prog=PACKAGE_NAME)
     parser.add_argument('--command', type=str,
                         choices=[
                             'train',
-                            'deid'], required=True)
+                            'deid',
+                            'serve',
+                            'optimize'], required=True)
     parser.add_argument('--data_dir', type=str, help='data sets directory')
     parser.add_argument('--train_file', type=str, default='train.bio', help='the file name of training set')
     parser.add_argument('--dev_file', type=str, default='dev.bio', help='the file name of development set')
@@ -19,6 +38,19 @@ def get_options(args=sys.argv[1:]):
     parser.add_argument('--workspace', type=str, required=True,
                         help='the workplace which is used to store data and trained models')
     parser.add_argument('--resume_training', type=bool, default=False, help='resume the last training process')
+    parser.add_argument('--train_jobs', type=int, default=1,
+                        help='the number of model trainings running in parallel processes')
+    parser.add_argument('--train_threads', type=int, help='the number of threads of each training process')
+    parser.add_argument('--flair_storage_mode', type=str, default='cpu', choices=['none', 'cpu', 'gpu'],
+                        help='where flair keeps the embeddings between epochs. none computes them in every epoch')
+    parser.add_argument('--no_embedding_cache', action='store_true',
+                        help='do not precompute the BERT embeddings into the on-disk cache of the workspace')
+    parser.add_argument('--embedding_cache_fp16', action='store_true',
+                        help='store the cached BERT embeddings in float16 on disk, loaded as float32 in memory')
+    parser.add_argument('--flair_checkpoint_epochs', type=int, default=10,
+                        help='the number of epochs between the checkpoints of the flair trainings. 0 disables them')
+    parser.add_argument('--spacy_ner_only_base', action='store_true',
+                        help='train the spacy models from en_core_web_lg without the tagger and the parser')
     parser.add_argument('--phi_types', type=str, nargs='+', help='customized PHI types')
 
     parser.add_argument('--wordvec_file', type=str, help='wordvec files')
@@ -26,6 +58,37 @@ def get_options(args=sys.argv[1:]):
     #
     parser.add_argument('--deid_file', type=str, help='the file name to be de-identified')
     parser.add_argument('--deid_output_dir', type=str, help='the file directory to be de-identified')
+    parser.add_argument('--deid_dir', type=str, help='the directory of the files to be de-identified')
+    parser.add_argument('--deid_pattern', type=str, default='*.txt',
+                        help='the glob pattern of the files in the deid_dir')
+    parser.add_argument('--deid_file_list', type=str, help='a file listing the file names to be de-identified')
+    parser.add_argument('--stream', action='store_true',
+                        help='de-identify the files in chunks of lines to keep the memory constant for large files')
+    parser.add_argument('--chunk_lines', type=int, default=1000,
+                        help='the number of lines predicted at a time in the stream mode')
+    parser.add_argument('--n_writers', type=int, default=4, help='the number of threads writing the outputs')
+    parser.add_argument('--max_in_flight', type=int, default=8,
+                        help='the maximum number of de-identified documents waiting to be written')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='the host of the de-identification server')
+    parser.add_argument('--port', type=int, default=8000, help='the port of the de-identification server')
+    parser.add_argument('--max_concurrency', type=int, default=16,
+                        help='the maximum number of requests processed by the server at the same time')
+    parser.add_argument('--max_batch_lines', type=int, default=256,
+                        help='the maximum number of lines in one micro batch of the server')
+    parser.add_argument('--batch_wait_ms', type=float, default=10,
+                        help='the milliseconds to wait for more requests before predicting a micro batch')
+    parser.add_argument('--n_workers', type=int, default=1, help='the number of threads to run the models in parallel')
+    parser.add_argument('--cascade', action='store_true',
+                        help='skip the Stanza and Flair models for the lines whose vote is decided by the cheaper models')
+    parser.add_argument('--quantized', action='store_true',
+                        help='use the int8 quantized Flair and Stanza models saved by the optimize command')
+    parser.add_argument('--cache_size', type=int, default=0,
+                        help='the number of repeated lines whose predictions are cached. 0 disables the cache')
+    parser.add_argument('--vote_weights', type=vote_weight, nargs='+', default=[],
+                        help='the weights of the models in the majority vote, e.g. flair_imbalanced=2. '
+                             'The other models have the weight 1')
+    parser.add_argument('--template_cache', action='store_true',
+                        help='keep the compiled html template in the workspace for the next runs of the deid command')
 
     options = parser.parse_args(args)
     return options
@@ -43,13 +106,51 @@ def main():
                           options.resume_training,
                           options.train_file,
                           options.dev_file,
-                          options.test_file)
+                          options.test_file,
+                          options.train_jobs,
+                          options.train_threads,
+                          options.flair_storage_mode,
+                          not options.no_embedding_cache,
+                          options.embedding_cache_fp16,
+                          options.spacy_ner_only_base,
+                          options.flair_checkpoint_epochs)
         trainer.train()
     elif command == 'deid':
         deider = PHIDeid(options.workspace,
-                         options.deid_output_dir)
-        doc = deider(options.deid_file)
-        deider.output(doc)
+                         options.deid_output_dir,
+                         options.n_workers,
+                         options.cache_size,
+                         CASCADE_ORDER if options.cascade else None,
+                         options.quantized,
+                         options.template_cache,
+                         vote_weights=dict(options.vote_weights))
+        if options.deid_dir is None and options.deid_file_list is None and options.stream:
+            deider.deid_stream(options.deid_file, options.chunk_lines)
+        elif options.deid_dir is None and options.deid_file_list is None:
+            doc = deider(options.deid_file)
+            deider.output(doc)
+        else:
+            deid_files = collect_deid_files(options.deid_dir, options.deid_pattern, options.deid_file_list)
+            if options.deid_file is not None:
+                deid_files.append(options.deid_file)
+            deider.deid_files(deid_files, options.n_writers, options.max_in_flight,
+                              options.stream, options.chunk_lines, options.deid_dir)
+    elif command == 'serve':
+        deider = PHIDeid(options.workspace,
+                         options.deid_output_dir,
+                         options.n_workers,
+                         options.cache_size,
+                         CASCADE_ORDER if options.cascade else None,
+                         options.quantized,
+                         vote_weights=dict(options.vote_weights))
+        serve(deider.model,
+              options.host,
+              options.port,
+              options.max_concurrency,
+              options.max_batch_lines,
+              options.batch_wait_ms / 1000)
+    elif command == 'optimize':
+        optimize_models(options.workspace, options.test_file)
 
 
 if __name__ == '__main__':
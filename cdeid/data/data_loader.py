@@ -1,30 +1,79 @@
 # Load bio2 format to Document object
 # Note: the tokenizer must use spacy pipeline
 # file format: columns split by whitespace
-# need to pass the indexes for text and ner columns
+# the token in the first column and the NER tag in the last column
+DOC_START = '-DOCSTART-'
 
 
-def load_doc(data_file):
+def read_bio(data_file, validate=True):
+    """Read a BIO file lazily and yield its sentences one by one
+
+    Documents are separated by -DOCSTART- lines and sentences by blank lines. Only the current
+    sentence is kept in memory. The NER tags in the last column are checked in the same pass.
+
+    Args:
+        data_file: the BIO file
+        validate: raise an exception with the line number if a NER tag is not in BIO format
+
+    Yields:
+        tuple (doc_id, lines) of a sentence. lines is the list of its raw lines ending with newline
+    """
+    doc_id = 0
+    doc_empty = True
+    lines = []
     with open(data_file, 'r') as f:
-        sents = []
-        sent_text = []
-        ner_tags = []
-        sent_ner_tags = []
-        for i, line in enumerate(f):
-            if line == '\n' and len(sent_text) != 0:
-                sents.append(sent_text)
-                sent_text = []
-                ner_tags.append(sent_ner_tags)
-                sent_ner_tags = []
-            cols = line.split()
-            if len(cols) < 2:
+        for line_number, line in enumerate(f, 1):
+            if DOC_START in line:
+                if len(lines) != 0:
+                    yield doc_id, lines
+                    lines = []
+                    doc_empty = False
+                if not doc_empty:
+                    doc_id += 1
+                    doc_empty = True
+                continue
+            if line.strip() == '':
+                if len(lines) != 0:
+                    yield doc_id, lines
+                    lines = []
+                    doc_empty = False
                 continue
-            sent_text.append(cols[0])
-            sent_ner_tags.append(cols[1].strip())
+            if validate:
+                ner_tag = line.split()[-1]
+                if not (ner_tag.startswith('B-') or ner_tag.startswith('I-') or ner_tag.startswith('O')):
+                    raise Exception('Input file {} does not have correct BIO format at line {}: {}'
+                                    .format(data_file, line_number, line.strip()))
+            if not line.endswith('\n'):
+                line += '\n'
+            lines.append(line)
+
+        if len(lines) != 0:
+            yield doc_id, lines
+
+
+# tokens and NER tags of the raw lines of a sentence
+def bio_tokens(lines):
+    tokens = []
+    ner_tags = []
+    for line in lines:
+        cols = line.split()
+        if len(cols) < 2:
+            continue
+        tokens.append(cols[0])
+        ner_tags.append(cols[-1])
+    return tokens, ner_tags
+
+
+def load_doc(data_file):
+    sents = []
+    ner_tags = []
+    for _, lines in read_bio(data_file, validate=False):
+        sent_text, sent_ner_tags = bio_tokens(lines)
+        if len(sent_text) != 0:
+            sents.append(sent_text)
+            ner_tags.append(sent_ner_tags)
 
-        # doc_text = concatenate_sents(sents)
-        # print(doc_text)
-        return sents, ner_tags
+    return sents, ner_tags
 
 
 def concatenate_sents(sentences):
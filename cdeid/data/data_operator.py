@@ -1,81 +1,79 @@
 import random
 import logging
+from contextlib import ExitStack
 from pathlib import Path
 
+from cdeid.data.data_loader import read_bio
 from cdeid.utils.resources import PACKAGE_NAME
 
 logger = logging.getLogger(PACKAGE_NAME)
 
 
-def load_data(data_file):
-    data = open(data_file).readlines()
-    return data
-
-
-def pass_bio_checking(lines):
-    for i, line in enumerate(lines):
-        if ('-DOCSTART-' in line) or line.strip() == '':
-            continue
-        # the NER tag in the last column
-        ner_tag = line.split()[-1]
-        if not (ner_tag.startswith('B-') or ner_tag.startswith('I-') or ner_tag.startswith('O')):
-            logger.error('Input file does not have correct BIO format at line {}.'.format(i))
-            return False
-    return True
-
-
-def parse_documents(content):
-    docs = []
-    doc = []
-    line = []
-    # convert doc to a list of lines
-    for item in content:
-        if '-DOCSTART-' in item:
-            if len(doc) != 0:
-                docs.append(doc)
-                doc = []
-            continue
-        if item == '' or item == '\n':
-            if len(line) != 0:
-                doc.append(line)
-                line = []
-            continue
-        line.append(item)
-
-    if len(doc) != 0:
-        docs.append(doc)
-
-    return docs
+# a text line has PHI if any of its NER tags begins an entity
+def has_phi(lines):
+    return any(line.split()[-1].startswith('B-') for line in lines)
 
 
 # proportion will be like 1.0 or 1.5 or 2.0 or 4.0.
 # Text lines with PHI is 10. 1.0 means the lines without PHI will be 10 * 1.0
-def sample_data_lines(docs, proportion, output_file, file_name):
-    all_lines = [line for doc in docs for line in doc]
-
-    lines_with_phi = [line for line in all_lines if sum('B-' in token for token in line) > 0]
-    lines_without_phi = [line for line in all_lines if sum('B-' in token for token in line) == 0]
-
-    logger.info('PHI lines: {}, No PHI lines: {}'.format(len(lines_with_phi), len(lines_without_phi)))
-
-    random.Random(2020).shuffle(lines_without_phi)
-    selected_lines_without_phi = random.sample(lines_without_phi, int(len(lines_with_phi) * proportion))
-
-    all_lines = lines_with_phi + selected_lines_without_phi
-
-    random.Random(2020).shuffle(all_lines)
-    if not Path(output_file).exists():
-        Path(output_file).mkdir()
-    with open(Path(output_file) / file_name, 'w', newline='\n') as f:
-        for line in all_lines:
-            for token in line:
-                f.write(token)
-            f.write('\n')
-        logger.info('Data file {} created.'.format(Path(output_file) / file_name))
-
-    # sampled_doc = []
-    # for line in all_lines:
-    #     sampled_doc += line
-    #     sampled_doc += ['\n']
-
-    return len(all_lines), len(lines_with_phi)
+def sample_data_lines(data_file, proportion, output_file, file_name):
+    return sample_data_proportions(data_file, {proportion: output_file}, file_name)[proportion]
+
+
+def sample_data_proportions(data_file, output_dirs, file_name, seed=2020):
+    """Sample the text lines of a BIO file for several proportions of the lines without PHI
+
+    All the lines with PHI are kept. The first pass counts the lines with and without PHI.
+    The second pass selects the lines without PHI by selection sampling with a seeded random
+    generator and writes the selected lines to the outputs of all the proportions at once.
+    Only one text line is kept in memory.
+
+    Args:
+        data_file: the BIO file
+        output_dirs: dict of proportion -> output directory
+        file_name: the file name of the sampled data in each output directory
+        seed: the seed of the random generator
+
+    Returns:
+        dict of proportion -> (the number of sampled lines, the number of lines with PHI)
+    """
+    n_with_phi = 0
+    n_without_phi = 0
+    for _, lines in read_bio(data_file):
+        if has_phi(lines):
+            n_with_phi += 1
+        else:
+            n_without_phi += 1
+
+    logger.info('PHI lines: {}, No PHI lines: {}'.format(n_with_phi, n_without_phi))
+
+    rng = random.Random(seed)
+    # the number of the lines without PHI still to be selected for each proportion
+    needed = {proportion: min(int(n_with_phi * proportion), n_without_phi) for proportion in output_dirs}
+    sizes = {proportion: n_with_phi + needed[proportion] for proportion in output_dirs}
+    remaining = n_without_phi
+    with ExitStack() as stack:
+        output_files = {}
+        for proportion, output_dir in output_dirs.items():
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+            output_files[proportion] = stack.enter_context(open(Path(output_dir) / file_name, 'w', newline='\n'))
+
+        for _, lines in read_bio(data_file, validate=False):
+            if has_phi(lines):
+                selected = list(output_files)
+            else:
+                # select with the probability (needed lines) / (remaining lines), which gives
+                # a uniform sample of exactly the needed lines
+                u = rng.random()
+                selected = [proportion for proportion in output_files if u * remaining < needed[proportion]]
+                for proportion in selected:
+                    needed[proportion] -= 1
+                remaining -= 1
+            for proportion in selected:
+                output_files[proportion].writelines(lines)
+                output_files[proportion].write('\n')
+
+    for proportion, output_dir in output_dirs.items():
+        logger.info('Data file {} created.'.format(Path(output_dir) / file_name))
+
+    return {proportion: (sizes[proportion], n_with_phi) for proportion in output_dirs}
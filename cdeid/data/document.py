@@ -1,4 +1,3 @@
-from cdeid.display.html_generator import add_html_tags_of_entities, generate_html
 import logging
 
 from cdeid.utils.resources import PACKAGE_NAME
@@ -7,21 +6,37 @@ logger = logging.getLogger(PACKAGE_NAME)
 
 
 class Token:
-    def __init__(self, text, ner_tag):
+    # millions of tokens are held in a batch, so no __dict__ for each token
+    __slots__ = ('text', 'ner_tag', 'start_char', 'end_char')
+
+    def __init__(self, text, ner_tag, start_char=None, end_char=None):
         self.text = text
         self.ner_tag = ner_tag
+        # character offsets of the token in the sentence text. None if unknown
+        self.start_char = start_char
+        self.end_char = end_char
 
 
 class Sentence:
     def __init__(self):
         self.id = 0
-        self.text = ''
+        self._text = ''
         self.sentence_number = 0
         self._tokens = []
-        self._entities = []  # entity (start_idx, end_idx, type)
-        self._ents = []  # entity (text, type)
+        # the entities are parsed on the first access and cached until the text or tokens change
+        self._entities = None  # entity (start_idx, end_idx, type)
+        self._ents = None  # entity (text, type)
         self._html_text = ''
 
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+        self._clear_entities()
+
     @property
     def tokens(self):
         return self._tokens
@@ -29,20 +44,28 @@ class Sentence:
     @tokens.setter
     def tokens(self, tokens):
         self._tokens = tokens
+        self._clear_entities()
 
     def add_token(self, token):
         self._tokens.append(token)
+        self._clear_entities()
+
+    def _clear_entities(self):
+        self._entities = None
+        self._ents = None
 
     # entity (start_idx, end_idx, type)
     @property
     def entities(self):
-        self._entities = self._parse_entities('index')
+        if self._entities is None:
+            self._entities = tuple(self._parse_entities('index'))
         return self._entities
 
     # entity (text, type)
     @property
     def ents(self):
-        self._ents = self._parse_entities('plain')
+        if self._ents is None:
+            self._ents = tuple(self._parse_entities('plain'))
         return self._ents
 
     # @property
@@ -89,8 +112,13 @@ class Sentence:
                     entity_type = None
                     continue
 
-                start_idx = self.text.index(entity_tokens[0].text, current_index)
-                end_idx = self.text.index(entity_tokens[-1].text, current_index) + len(entity_tokens[-1].text)
+                if entity_tokens[0].start_char is not None and entity_tokens[-1].end_char is not None:
+                    start_idx = entity_tokens[0].start_char
+                    end_idx = entity_tokens[-1].end_char
+                else:
+                    # search the tokens in the text if they do not have offsets
+                    start_idx = self.text.index(entity_tokens[0].text, current_index)
+                    end_idx = self.text.index(entity_tokens[-1].text, current_index) + len(entity_tokens[-1].text)
                 if mode == 'index':
                     entity_list.append((start_idx, end_idx, entity_type))
                 elif mode == 'plain':
@@ -108,8 +136,10 @@ class Document:
     def __init__(self):
         self.text = ''
         self._sentences = []
-        self._entities = []
-        self._ents = []
+        # the entities of each sentence are collected on the first access and cached
+        # until the sentences change
+        self._entities = None
+        self._ents = None
 
     @property
     def sentences(self):
@@ -118,20 +148,26 @@ class Document:
     @sentences.setter
     def sentences(self, sentences):
         self._sentences = sentences
+        self._entities = None
+        self._ents = None
 
     def add_sentence(self, sentence):
         self._sentences.append(sentence)
+        self._entities = None
+        self._ents = None
 
+    # tuple of the entities (start_idx, end_idx, type) of each sentence
     @property
     def entities(self):
-        for sent in self._sentences:
-            self._entities.append(sent.entities)
+        if self._entities is None:
+            self._entities = tuple(sent.entities for sent in self._sentences)
         return self._entities
 
+    # tuple of the entities (text, type) of each sentence
     @property
     def ents(self):
-        for sent in self._sentences:
-            self._ents.append(sent.ents)
+        if self._ents is None:
+            self._ents = tuple(sent.ents for sent in self._sentences)
         return self._ents
 
     # def generate_html_file(self, output_file):
@@ -1,14 +1,27 @@
-def annotate_sent(sent):
-    tmp_text = sent.text
-    offset = 0
-    for entity in sent.entities:
-        tmp_text = tmp_text[:entity[0] + offset] + '<**' + entity[2] + '**>' + tmp_text[entity[1] + offset:]
-        offset += (len(entity[2]) + 6 - (entity[1] - entity[0]))
-    return tmp_text
+from cdeid.utils.span_renderer import render_spans
 
 
-def annotate_doc(doc, output_file):
-    annotated_sentences = [annotate_sent(sent) for sent in doc.sentences]
+# replace the entity with its type, e.g. <**PERSON**>
+def type_tag(words, entity_type):
+    return '<**' + entity_type + '**>'
+
+
+# replace the entities with surrogate values by type, e.g. {'PERSON': 'John Doe'}.
+# The types without surrogate values are replaced with type tags
+def surrogate_replacer(surrogates):
+    def replace(words, entity_type):
+        if entity_type in surrogates:
+            return surrogates[entity_type]
+        return type_tag(words, entity_type)
+    return replace
+
+
+def annotate_sent(sent, replace=type_tag):
+    return render_spans(sent.text, sent.entities, replace)
+
+
+def annotate_doc(doc, output_file, replace=type_tag):
+    annotated_sentences = [annotate_sent(sent, replace) for sent in doc.sentences]
     annotated_text = '\n'.join(annotated_sentences)
     with open(output_file, 'w+') as fo:
         fo.write(annotated_text)
@@ -0,0 +1,183 @@
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cdeid.data.document import Document
+from cdeid.deidentifier.annotator import annotate_sent
+from cdeid.utils.resources import PACKAGE_NAME
+
+logger = logging.getLogger(PACKAGE_NAME)
+
+
+class _BatchItem:
+    def __init__(self, texts):
+        self.texts = texts
+        self.lines = [text.splitlines() for text in texts]
+        self.docs = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """Collect the texts of concurrent requests into one batch for the ensemble model
+
+    The first waiting request opens a batch which is closed when it reaches max_batch_lines
+    or after max_wait seconds. All the lines of the batch are predicted with one call of
+    EnsembleModel.predict_lines in the batcher thread, so the models are only used by one
+    thread at a time.
+    """
+    def __init__(self, model, max_batch_lines=256, max_wait=0.01, batch_size=32):
+        self.model = model
+        self.max_batch_lines = max_batch_lines
+        self.max_wait = max_wait
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # predict the texts and return a list of Document
+    def predict(self, texts):
+        item = _BatchItem(texts)
+        self.queue.put(item)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.docs
+
+    def run(self):
+        while True:
+            items = [self.queue.get()]
+            n_lines = sum(len(lines) for lines in items[0].lines)
+            deadline = time.time() + self.max_wait
+            while n_lines < self.max_batch_lines:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                items.append(item)
+                n_lines += sum(len(lines) for lines in item.lines)
+
+            batch_lines = [line for item in items for lines in item.lines for line in lines]
+            logger.debug('Predict a batch of {} requests, {} lines'.format(len(items), len(batch_lines)))
+            try:
+                results = self.model.predict_lines(batch_lines, batch_size=self.batch_size)
+            except Exception as e:
+                logger.exception('Prediction failed')
+                for item in items:
+                    item.error = e
+                    item.done.set()
+                continue
+
+            index = 0
+            for item in items:
+                item.docs = []
+                for text, lines in zip(item.texts, item.lines):
+                    doc = Document()
+                    doc.text = text
+                    for sentence, _ in results[index:index + len(lines)]:
+                        doc.add_sentence(sentence)
+                    index += len(lines)
+                    item.docs.append(doc)
+                item.done.set()
+
+
+# JSON of a de-identified Document
+def doc_to_json(doc):
+    return {
+        'annotated_text': '\n'.join(annotate_sent(sent) for sent in doc.sentences),
+        'sentences': [{'text': sent.text,
+                       'tokens': [[token.text, token.ner_tag] for token in sent.tokens],
+                       'entities': [list(entity) for entity in sent.entities]}
+                      for sent in doc.sentences]
+    }
+
+
+class DeidRequestHandler(BaseHTTPRequestHandler):
+    # GET /health
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_json(404, {'error': 'Not found: {}'.format(self.path)})
+            return
+        self.send_json(200, {'status': 'ok'})
+
+    # POST /deid with {"text": "..."} or {"texts": ["...", "..."]}
+    def do_POST(self):
+        if self.path != '/deid':
+            self.send_json(404, {'error': 'Not found: {}'.format(self.path)})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            if not isinstance(request, dict):
+                raise ValueError('the request must be a JSON object')
+            texts = request['texts'] if 'texts' in request else [request['text']]
+            if not isinstance(texts, list):
+                raise ValueError('texts must be a list of strings')
+            if not all(isinstance(text, str) for text in texts):
+                raise ValueError('texts must be strings')
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {'error': 'Invalid request: {}'.format(e)})
+            return
+
+        # reject the request when the server is busy with max_concurrency requests
+        if not self.server.slots.acquire(blocking=False):
+            self.send_json(503, {'error': 'Too many concurrent requests'})
+            return
+        try:
+            docs = self.server.batcher.predict(texts)
+            self.send_json(200, {'results': [doc_to_json(doc) for doc in docs]})
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+        finally:
+            self.server.slots.release()
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class DeidServer(ThreadingHTTPServer):
+    """HTTP server which keeps the ensemble model loaded and de-identifies the posted texts
+
+    Endpoints:
+        GET /health: {"status": "ok"}
+        POST /deid: {"text": "..."} or {"texts": [...]} -> {"results": [...]}
+
+    Args:
+        model: the loaded EnsembleModel
+        host, port: the address to listen on
+        max_concurrency: the maximum number of requests being processed, others get 503
+        max_batch_lines: the maximum number of lines in one micro batch
+        max_wait: the seconds to wait for more requests before predicting a micro batch
+    """
+    daemon_threads = True
+
+    def __init__(self, model, host='127.0.0.1', port=8000, max_concurrency=16,
+                 max_batch_lines=256, max_wait=0.01):
+        super().__init__((host, port), DeidRequestHandler)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.batcher = MicroBatcher(model, max_batch_lines, max_wait)
+
+
+def serve(model, host='127.0.0.1', port=8000, max_concurrency=16, max_batch_lines=256, max_wait=0.01):
+    server = DeidServer(model, host, port, max_concurrency, max_batch_lines, max_wait)
+    logger.info('De-identification server listening on http://{}:{}'.format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info('De-identification server stopped')
+    finally:
+        server.server_close()
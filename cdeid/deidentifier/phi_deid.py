@@ -1,7 +1,11 @@
 import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from cdeid.deidentifier.annotator import annotate_doc
-from cdeid.display.html_generator import generate_html
+from cdeid.deidentifier.annotator import annotate_doc, annotate_sent
+from cdeid.display.html_generator import generate_html, mako_module_directory, write_html
 from cdeid.models.ensemble_model import EnsembleModel
 from cdeid.utils.resources import PACKAGE_NAME
 from pathlib import Path
@@ -9,10 +13,27 @@ from pathlib import Path
 logger = logging.getLogger(PACKAGE_NAME)
 
 
+# collect the files to be de-identified from a directory with a glob pattern and/or a file list
+def collect_deid_files(deid_dir=None, pattern='*.txt', file_list=None):
+    deid_files = []
+    if deid_dir is not None:
+        deid_files += sorted(str(path) for path in Path(deid_dir).glob(pattern) if path.is_file())
+    if file_list is not None:
+        with open(file_list, 'r') as f:
+            deid_files += [line.strip() for line in f if line.strip() != '']
+    return deid_files
+
+
 class PHIDeid:
     def __init__(self,
                  workspace,
-                 deid_output_dir):
+                 deid_output_dir,
+                 n_workers=1,
+                 cache_size=0,
+                 cascade=None,
+                 quantized=False,
+                 template_cache=False,
+                 vote_weights=None):
         logger.info('Loading models......')
         model_dir = Path(workspace) / 'models'
         self.model = EnsembleModel(str(model_dir / 'balanced' / 'best-model.pt'),
@@ -20,9 +41,16 @@ class PHIDeid:
                                        str(model_dir / 'balanced' / 'stanza_model.pt'),
                                        str(model_dir / 'best-model.pt'),
                                        str(model_dir / 'model-best'),
-                                       str(model_dir / 'stanza_model.pt'))
+                                       str(model_dir / 'stanza_model.pt'),
+                                       n_workers=n_workers,
+                                       cache_size=cache_size,
+                                       cascade=cascade,
+                                       quantized=quantized,
+                                       vote_weights=vote_weights)
         logger.info('Model loaded......')
         self.deid_output_dir = deid_output_dir
+        # keep the compiled html template in the workspace for the next runs
+        self.module_directory = mako_module_directory(workspace) if template_cache else None
         # self.deid_file = deid_file
 
     def __call__(self, deid_file):
@@ -33,14 +61,158 @@ class PHIDeid:
 
         return doc
 
-    def output(self, doc):
-        html_file = self.deid_output_dir + '/' \
-                    + str(Path(Path(self.deid_file).parts[-1]).with_suffix('.html'))
-        generate_html(doc, html_file)
+    # the html file and the annotated file of a de-identified file. The files under deid_dir keep their paths
+    # relative to deid_dir in the output directory, the other files their names
+    def output_files(self, deid_file, deid_dir=None):
+        file_name = Path(Path(deid_file).parts[-1])
+        if deid_dir is not None:
+            try:
+                file_name = Path(deid_file).resolve().relative_to(Path(deid_dir).resolve())
+            except ValueError:
+                pass
+        html_file = self.deid_output_dir + '/' + file_name.with_suffix('.html').as_posix()
+        annotated_file = self.deid_output_dir + '/' + file_name.with_suffix('.annotated.txt').as_posix()
+        return html_file, annotated_file
+
+    # the outputs are written to temporary files and renamed, so an interrupted run leaves no partial outputs
+    def output(self, doc, deid_file=None, deid_dir=None):
+        html_file, annotated_file = self.output_files(deid_file or self.deid_file, deid_dir)
+        Path(html_file).parent.mkdir(parents=True, exist_ok=True)
+        generate_html(doc, html_file + '.tmp', module_directory=self.module_directory)
+        annotate_doc(doc, annotated_file + '.tmp')
+        os.replace(annotated_file + '.tmp', annotated_file)
+        os.replace(html_file + '.tmp', html_file)
+
+    def deid_stream(self, deid_file, chunk_lines=1000, deid_dir=None):
+        """De-identify a file of any size in chunks of lines
+
+        The lines are read lazily and predicted chunk by chunk. The annotated text and the html
+        are written while the lines are predicted, so the memory does not grow with the file size.
+        They are written to temporary files and renamed at the end, so a failed run leaves no outputs.
+
+        Args:
+            deid_file: the file name to be de-identified
+            chunk_lines: the number of lines predicted at a time
+            deid_dir: the input directory of deid_file, whose relative path is kept in the output directory
+
+        Returns:
+            the number of de-identified lines
+        """
+        html_file, annotated_file = self.output_files(deid_file, deid_dir)
+        Path(html_file).parent.mkdir(parents=True, exist_ok=True)
+        n_lines = 0
+        # the outputs are streamed into temporary files, which are renamed when the whole file is de-identified
+        try:
+            with open(deid_file, 'r') as f, open(annotated_file + '.tmp', 'w+') as fo:
+                # split the lines in the same way as str.splitlines
+                lines = (part for line in f for part in line.splitlines())
+                sentences = (sentence for sentence, _ in self.model.predict_stream(lines, chunk_lines))
+
+                def annotate(sentences):
+                    nonlocal n_lines
+                    for sentence in sentences:
+                        if n_lines > 0:
+                            fo.write('\n')
+                        fo.write(annotate_sent(sentence))
+                        n_lines += 1
+                        yield sentence
+
+                write_html(annotate(sentences), html_file + '.tmp', module_directory=self.module_directory)
+        except BaseException:
+            for tmp_file in [annotated_file + '.tmp', html_file + '.tmp']:
+                if Path(tmp_file).exists():
+                    Path(tmp_file).unlink()
+            raise
+        os.replace(annotated_file + '.tmp', annotated_file)
+        os.replace(html_file + '.tmp', html_file)
+
+        return n_lines
+
+    def deid_files(self, deid_files, n_writers=4, max_in_flight=8, stream=False, chunk_lines=1000, deid_dir=None):
+        """De-identify a list of files with the loaded models
+
+        The files are predicted one by one and their outputs are written by a pool of writer
+        threads. At most max_in_flight documents wait to be written. The files whose outputs
+        already exist are skipped, so an interrupted run can be resumed. A file which fails is
+        logged and the other files are still de-identified.
+
+        Args:
+            deid_files: list of the file names to be de-identified
+            n_writers: the number of threads writing the outputs
+            max_in_flight: the maximum number of predicted documents waiting to be written
+            stream: de-identify each file in chunks of chunk_lines with deid_stream
+            chunk_lines: the number of lines predicted at a time in the stream mode
+            deid_dir: the input directory. The outputs of its files keep their relative paths
+
+        Returns:
+            the number of de-identified files
+        """
+        # two input files must not be written to the same outputs
+        outputs = {}
+        for deid_file in deid_files:
+            html_file, _ = self.output_files(deid_file, deid_dir)
+            if html_file in outputs and outputs[html_file] != deid_file:
+                raise Exception('The files {} and {} have the same output {}'
+                                .format(outputs[html_file], deid_file, html_file))
+            outputs[html_file] = deid_file
+
+        start_time = time.time()
+        n_files = 0
+        n_lines = 0
+        n_skipped = 0
+        failed_files = []
+
+        # wait for the output of a file to be written. return True if written
+        def wait_output(deid_file, future):
+            try:
+                future.result()
+                return True
+            except Exception:
+                logger.exception('Failed to write the outputs of {}'.format(deid_file))
+                failed_files.append(deid_file)
+                return False
+
+        with ThreadPoolExecutor(max_workers=n_writers) as writer:
+            in_flight = deque()
+            for deid_file in deid_files:
+                if all(Path(output_file).exists() for output_file in self.output_files(deid_file, deid_dir)):
+                    n_skipped += 1
+                    continue
 
-        annotated_file = self.deid_output_dir + '/' \
-                         + str(Path(Path(self.deid_file).parts[-1]).with_suffix('.annotated.txt'))
-        annotate_doc(doc, annotated_file)
+                try:
+                    if stream:
+                        n_lines += self.deid_stream(deid_file, chunk_lines, deid_dir)
+                        n_files += 1
+                        continue
+                    doc = self(deid_file)
+                except Exception:
+                    logger.exception('Failed to de-identify {}'.format(deid_file))
+                    failed_files.append(deid_file)
+                    continue
 
+                n_lines += len(doc.sentences)
+                in_flight.append((deid_file, writer.submit(self.output, doc, deid_file, deid_dir)))
+                while len(in_flight) >= max_in_flight:
+                    n_files += wait_output(*in_flight.popleft())
 
+            for deid_file, future in in_flight:
+                n_files += wait_output(deid_file, future)
 
+        duration = time.time() - start_time
+        logger.info('De-identified {} files ({} lines) in {:.1f} seconds, {} files skipped, {} files failed'
+                    .format(n_files, n_lines, duration, n_skipped, len(failed_files)))
+        if len(failed_files) > 0:
+            logger.warning('Failed files: {}'.format(', '.join(failed_files)))
+        if duration > 0:
+            logger.info('Throughput: {:.2f} files/sec, {:.2f} lines/sec'
+                        .format(n_files / duration, n_lines / duration))
+        cache_stats = self.model.cache_stats()
+        if cache_stats is not None:
+            logger.info('Line cache: {hits} hits, {misses} misses, hit rate {hit_rate:.2%}, {size} lines'
+                        .format(**cache_stats))
+        if self.model.cascade is not None:
+            cascade_report = self.model.cascade_report()
+            for name, skip_rate in cascade_report['skip_rate'].items():
+                logger.info('Cascade: {} skipped {:.2%} of {} lines, {:.1f} seconds saved'
+                            .format(name, skip_rate, cascade_report['lines'], cascade_report['seconds_saved'][name]))
+        return n_files
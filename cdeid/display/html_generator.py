@@ -1,35 +1,52 @@
+import os
+from functools import lru_cache
+from mako.runtime import Context
 from mako.template import Template
 from pathlib import Path
 
+from cdeid.utils.span_renderer import render_spans
+
 HTML_TAG_1 = '<span class="entity '
 HTML_TAG_2 = '"><span class="words">'
 HTML_TAG_3 = '</span><span class="ner">'
 HTML_TAG_4 = '</span></span>'
 
 
-def add_html_tags_of_entities(text, entities):
-    offset = 0
-    for entity in entities:
-        tag_before = HTML_TAG_1 + entity[2].lower() + HTML_TAG_2
-        tag_after = HTML_TAG_3 + entity[2].upper() + HTML_TAG_4
+# wrap the words of an entity with the html tags of its type
+def html_span(words, entity_type):
+    return HTML_TAG_1 + entity_type.lower() + HTML_TAG_2 + words + HTML_TAG_3 + entity_type.upper() + HTML_TAG_4
 
-        text = text[:(entity[0] + offset)] \
-               + tag_before + text[(entity[0] + offset):(entity[1] + offset)] \
-               + tag_after + text[(entity[1] + offset):]
 
-        offset += (len(tag_before) + len(tag_after))
+def add_html_tags_of_entities(text, entities):
+    return render_spans(text, entities, html_span)
+
 
-    return text
+# the directory of the compiled template modules in a workspace. Mako imports the modules from it, so it is
+# only accessible by the user
+def mako_module_directory(workspace):
+    module_directory = Path(workspace) / '.mako_modules'
+    module_directory.mkdir(parents=True, exist_ok=True)
+    os.chmod(str(module_directory), 0o700)
+    return str(module_directory)
 
 
-def generate_html(doc, output_file='./display.html', template='display_template.html'):
+# compiled templates are cached in the process. With a module_directory, Mako also keeps the compiled modules
+# there for other processes
+@lru_cache(maxsize=None)
+def get_template(template='display_template.html', module_directory=None):
     template_file = str(Path(__file__).parent.absolute() / template)
-    temp = Template(filename=template_file)
-    tagged_lines = []
-    for sent in doc.sentences:
-        tagged_lines.append(add_html_tags_of_entities(sent.text, sent.entities))
+    return Template(filename=template_file, module_directory=module_directory)
+
+
+def generate_html(doc, output_file='./display.html', template='display_template.html', module_directory=None):
+    write_html(doc.sentences, output_file, template, module_directory)
+
 
-    html_content = temp.render(doc=tagged_lines)
+# render the html of an iterable of sentences directly into the output file.
+# The sentences are consumed one by one while the template is rendered
+def write_html(sentences, output_file='./display.html', template='display_template.html', module_directory=None):
+    temp = get_template(template, module_directory)
+    tagged_lines = (add_html_tags_of_entities(sent.text, sent.entities) for sent in sentences)
 
     with open(output_file, 'w+') as fo:
-        fo.write(html_content)
+        temp.render_context(Context(fo, doc=tagged_lines))
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from cdeid.utils.lazy_loader import lazy_import
+from cdeid.utils.resources import PACKAGE_NAME
+
+torch = lazy_import('torch')
+
+logger = logging.getLogger(PACKAGE_NAME)
+
+
+# key of a sentence in the cache: hash of its tokens
+def sentence_key(sentence):
+    text = '\n'.join(token.text for token in sentence)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk store of the token embeddings computed by a static (not fine-tuned) Flair embedding
+
+    The embeddings of each batch of new sentences are written once to a shard: a .npy matrix of
+    the token vectors, read back memory-mapped, and a .json index of sentence key -> (offset,
+    number of tokens). Shards are only added, so the store is shared by the balanced and the
+    imbalanced trainings, also when they run in parallel processes.
+
+    The shards are memory-mapped to look up the sentences, but attach copies the vectors of every
+    sentence into float32 tensors on its tokens. The cache saves the computation of the embeddings
+    in every epoch and training, not memory: the attached embeddings take the same RAM as the
+    embeddings computed by Flair.
+
+    Args:
+        cache_dir: the directory of the shards
+        fp16: store the vectors in float16, half of the disk space. They are converted back to
+              float32 when attached to the tokens
+    """
+    def __init__(self, cache_dir, fp16=False):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.dtype = np.float16 if fp16 else np.float32
+        # sentence key -> (vectors of the shard, offset, number of tokens)
+        self.index = {}
+        self.load_shards()
+
+    def load_shards(self):
+        for index_file in sorted(self.cache_dir.glob('*.json')):
+            vector_file = index_file.with_suffix('.npy')
+            if not vector_file.exists():
+                continue
+            vectors = np.load(str(vector_file), mmap_mode='r')
+            with open(index_file, 'r', encoding='utf-8') as f:
+                for key, (offset, length) in json.load(f).items():
+                    self.index.setdefault(key, (vectors, offset, length))
+
+    # compute the embeddings of the sentences not in the cache and write them into a new shard
+    def update(self, embedding, sentences, batch_size=32):
+        missing = {}
+        for sentence in sentences:
+            key = sentence_key(sentence)
+            if key not in self.index and key not in missing:
+                missing[key] = sentence
+        if not missing:
+            return
+        logger.info('Compute {} embeddings of {} sentences'.format(embedding.name, len(missing)))
+
+        keys = list(missing)
+        n_tokens = sum(len(missing[key]) for key in keys)
+        shard = '{}-{}'.format(int(time.time() * 1000), os.getpid())
+        vector_file = self.cache_dir / (shard + '.npy')
+        index_file = self.cache_dir / (shard + '.json')
+        vectors = np.lib.format.open_memmap(str(vector_file) + '.tmp', mode='w+', dtype=self.dtype,
+                                            shape=(n_tokens, embedding.embedding_length))
+        shard_index = {}
+        offset = 0
+        with torch.no_grad():
+            for start in range(0, len(keys), batch_size):
+                batch = [missing[key] for key in keys[start:start + batch_size]]
+                embedding.embed(batch)
+                for key, sentence in zip(keys[start:start + batch_size], batch):
+                    for i, token in enumerate(sentence):
+                        vectors[offset + i] = token.get_embedding().cpu().numpy()
+                    shard_index[key] = (offset, len(sentence))
+                    offset += len(sentence)
+                    sentence.clear_embeddings()
+        vectors.flush()
+        del vectors
+
+        # the index is written last. A shard without index is ignored
+        os.replace(str(vector_file) + '.tmp', str(vector_file))
+        with open(str(index_file) + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(shard_index, f)
+        os.replace(str(index_file) + '.tmp', str(index_file))
+
+        vectors = np.load(str(vector_file), mmap_mode='r')
+        for key, (offset, length) in shard_index.items():
+            self.index.setdefault(key, (vectors, offset, length))
+
+    # set the cached embeddings to the tokens of the sentences, copied into float32 tensors in memory.
+    # Return the number of sentences found in the cache
+    def attach(self, embedding_name, sentences):
+        n_found = 0
+        for sentence in sentences:
+            entry = self.index.get(sentence_key(sentence))
+            if entry is None:
+                continue
+            vectors, offset, length = entry
+            sentence_vectors = torch.from_numpy(np.array(vectors[offset:offset + length], dtype=np.float32))
+            for token, vector in zip(sentence, sentence_vectors):
+                token.set_embedding(embedding_name, vector)
+            n_found += 1
+        return n_found
@@ -1,149 +1,306 @@
-from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
 import re
-import spacy
-import stanza
-from flair.models import SequenceTagger as flair
-from flair.data import Sentence as FlairSentence, build_spacy_tokenizer
+import threading
+import time
 
 from cdeid.data.data_loader import concatenate_sents
-from cdeid.utils.converter import to_bio2, entity_strip
+from cdeid.utils.converter import entity_strip
 from cdeid.data.document import Document, Sentence, Token
+from cdeid.models.line_cache import LineCache
+from cdeid.models.majority_voter import MajorityVoter
+from cdeid.models.model_optimizer import load_quantized_flair, load_quantized_stanza
 import logging
 
+import numpy as np
+
+from cdeid.utils.lazy_loader import lazy_import
 from cdeid.utils.scorer import score_by_entity
-from cdeid.utils.resources import SPACY_PRETRAINED_MODEL_LG, PACKAGE_NAME
+from cdeid.utils.resources import PACKAGE_NAME
+
+# the toolkits are imported on the first use
+spacy = lazy_import('spacy')
+spacy_tokens = lazy_import('spacy.tokens')
+spacy_ml = lazy_import('spacy._ml')
+stanza = lazy_import('stanza')
+stanza_doc = lazy_import('stanza.models.common.doc')
+flair_data = lazy_import('flair.data')
+flair_models = lazy_import('flair.models')
+torch = lazy_import('torch')
 
 logger = logging.getLogger(PACKAGE_NAME)
-nlp = spacy.load(SPACY_PRETRAINED_MODEL_LG)
+
+
+# the order of the models in the majority vote. flair_imbalanced is the best F1 and wins the ties
+VOTE_ORDER = ('flair_imbalanced', 'spacy', 'stanza', 'flair', 'spacy_imbalanced', 'stanza_imbalanced')
+
+# the stages of the cascaded vote, cheapest models first
+CASCADE_ORDER = (('spacy', 'spacy_imbalanced'), ('stanza', 'stanza_imbalanced'), ('flair', 'flair_imbalanced'))
+
+
+# tokenize the lines once with the spacy tokenizer. The token Docs are shared by all the models
+def tokenize_lines(spacy_model, lines, batch_size=32):
+    return list(spacy_model.tokenizer.pipe(lines, batch_size=batch_size))
+
+
+# group the lines into batches of similar lengths to reduce the padding of the Flair and Stanza models
+# The lines are sorted by the number of tokens, longest first, and a batch is closed when its padded size
+# (longest line x number of lines) would exceed max_tokens or it has batch_size lines
+# return a list of batches of line indices
+def length_batches(docs_tokens, max_tokens=4096, batch_size=32):
+    batches = []
+    batch = []
+    batch_length = 0
+    for k in sorted(range(len(docs_tokens)), key=lambda k: len(docs_tokens[k]), reverse=True):
+        if len(batch) > 0 and (len(batch) >= batch_size or batch_length * (len(batch) + 1) > max_tokens):
+            batches.append(batch)
+            batch = []
+        if len(batch) == 0:
+            batch_length = len(docs_tokens[k])
+        batch.append(k)
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
+
+
+# put back 'O' for the whitespace tokens which are not sent to the model
+def restore_space_tags(doc_tokens, tags):
+    tags = iter(tags)
+    return ['O' if token.is_space else next(tags) for token in doc_tokens]
+
+
+# load a spacy model, with only the tokenizer and the ner component if ner_only. The entities do not depend
+# on the tagger and the parser. With a vocab, the model uses it instead of loading its own vocab and vectors
+def load_spacy(model_path, ner_only=True, vocab=None):
+    meta = spacy.util.get_model_meta(model_path)
+    disable = [name for name in meta.get('pipeline', []) if name != 'ner'] if ner_only else []
+    if vocab is None:
+        return spacy.load(model_path, disable=disable)
+    # the names in disable are also excluded from the files loaded by Language.from_disk
+    return spacy.load(model_path, vocab=vocab, disable=disable + ['vocab'])
+
+
+# the spacy models trained from the same base model have the same vectors. The vocab of one can be shared
+def same_spacy_vectors(model_path, model_path_other):
+    meta = spacy.util.get_model_meta(model_path)
+    meta_other = spacy.util.get_model_meta(model_path_other)
+    return (meta.get('lang') == meta_other.get('lang') and meta.get('vectors') is not None and
+            meta.get('vectors') == meta_other.get('vectors'))
+
+
+# replace the vector table loaded into memory by a read-only memory map of the vectors file, shared with the
+# other processes loading the same model. The StaticVectors layers read the table from the registry of thinc,
+# so the memory map is linked there too and the table in memory is released
+def mmap_spacy_vectors(spacy_model, model_path):
+    vectors_file = Path(model_path) / 'vocab' / 'vectors'
+    if not vectors_file.exists():
+        return False
+    data = np.load(str(vectors_file), mmap_mode='r')
+    if data.shape != spacy_model.vocab.vectors.data.shape or data.dtype != spacy_model.vocab.vectors.data.dtype:
+        return False
+    spacy_model.vocab.vectors.data = data
+    spacy_ml.link_vectors_to_models(spacy_model.vocab, skip_rank=True)
+    return True
+
+
+# share one word embedding between the NER models of two Stanza pipelines when they have the same word
+# vocab and weights. The embeddings are fine-tuned in the training by default and are not shareable then
+def share_stanza_word_emb(stanza_model, stanza_model_other):
+    trainer = stanza_model.processors['ner'].trainer
+    trainer_other = stanza_model_other.processors['ner'].trainer
+    word_emb = getattr(trainer.model, 'word_emb', None)
+    word_emb_other = getattr(trainer_other.model, 'word_emb', None)
+    if word_emb is None or word_emb_other is None or word_emb.weight.shape != word_emb_other.weight.shape:
+        return False
+    if trainer.vocab['word']._id2unit != trainer_other.vocab['word']._id2unit:
+        return False
+    if not torch.equal(word_emb.weight, word_emb_other.weight):
+        return False
+    word_emb.weight.requires_grad_(False)
+    trainer_other.model.word_emb = word_emb
+    return True
+
+
+# BIOLU tags of each line. The pipeline components of spacy run on new Docs with the tokens of the lines.
+# The tokenizer Docs are never annotated: the spacy NER keeps the entities already set on a Doc, so two
+# models sharing a vocab would otherwise see the entities of each other
+def spacy_tags(spacy_model, docs_tokens, batch_size=32):
+    docs = (spacy_tokens.Doc(spacy_model.vocab,
+                             words=[token.text for token in doc_tokens],
+                             spaces=[bool(token.whitespace_) for token in doc_tokens])
+            for doc_tokens in docs_tokens)
+    for _, proc in spacy_model.pipeline:
+        if hasattr(proc, 'pipe'):
+            docs = proc.pipe(docs, batch_size=batch_size)
+        else:
+            docs = (proc(doc) for doc in docs)
+    return [[token.ent_iob_ if token.ent_iob_ == 'O' else (token.ent_iob_ + '-' + token.ent_type_)
+             for token in doc_spacy] for doc_spacy in docs]
+
+
+# BIOES tags of each line. All the lines are tagged as one multi-sentence Stanza document
+def stanza_tags(stanza_model, docs_tokens):
+    sentences = []
+    offset = 0
+    for doc_tokens in docs_tokens:
+        sentences.append([{stanza_doc.TEXT: token.text,
+                           stanza_doc.MISC: '{}={}|{}={}'.format(stanza_doc.START_CHAR, token.idx + offset,
+                                                                 stanza_doc.END_CHAR, token.idx + len(token) + offset)}
+                          for token in doc_tokens if not token.is_space])
+        offset += len(doc_tokens.text) + 1
+    doc_stanza = stanza_doc.Document(sentences, '\n'.join(doc_tokens.text for doc_tokens in docs_tokens))
+    doc_stanza = stanza_model.processors['ner'].process(doc_stanza)
+    return [restore_space_tags(doc_tokens, [token.ner for token in sent.tokens])
+            for doc_tokens, sent in zip(docs_tokens, doc_stanza.sentences)]
+
+
+# BIO tags of each line. Flair predicts the sentences built from the token lists with mini batches
+def flair_tags(flair_model, docs_tokens, batch_size=32):
+    flair_sentences = [flair_data.Sentence([token.text for token in doc_tokens if not token.is_space])
+                       for doc_tokens in docs_tokens]
+    flair_model.predict(flair_sentences, mini_batch_size=batch_size)
+    return [restore_space_tags(doc_tokens, [token.get_tag('ner').value for token in flair_sentence])
+            for doc_tokens, flair_sentence in zip(docs_tokens, flair_sentences)]
+
+
+# tags of each line by two Flair taggers with the same static embeddings. The embeddings are computed by the
+# first tagger, kept on the tokens and reused by the second tagger, which clears them afterwards
+def flair_pair_tags(flair_model, flair_model_other, docs_tokens, batch_size=32):
+    flair_sentences = [flair_data.Sentence([token.text for token in doc_tokens if not token.is_space])
+                       for doc_tokens in docs_tokens]
+    preds = []
+    for model, storage_mode in [(flair_model, 'cpu'), (flair_model_other, 'none')]:
+        model.predict(flair_sentences, mini_batch_size=batch_size, embedding_storage_mode=storage_mode)
+        preds.append([restore_space_tags(doc_tokens, [token.get_tag('ner').value for token in flair_sentence])
+                      for doc_tokens, flair_sentence in zip(docs_tokens, flair_sentences)])
+    return preds
+
+
+# the embeddings of the Flair taggers are shareable if they have the same names, are not fine-tuned
+# and have the same weights
+def same_flair_embeddings(flair_model, flair_model_other):
+    embeddings = getattr(flair_model.embeddings, 'embeddings', [flair_model.embeddings])
+    embeddings_other = getattr(flair_model_other.embeddings, 'embeddings', [flair_model_other.embeddings])
+    if [embedding.name for embedding in embeddings] != [embedding.name for embedding in embeddings_other]:
+        return False
+    if not all(embedding.static_embeddings for embedding in embeddings + embeddings_other):
+        return False
+    state = flair_model.embeddings.state_dict()
+    state_other = flair_model_other.embeddings.state_dict()
+    if state.keys() != state_other.keys():
+        return False
+    try:
+        return all(torch.equal(state[key], state_other[key]) for key in state)
+    except (TypeError, RuntimeError):
+        # e.g. the packed parameters of the quantized layers
+        return False
+
+
+# run a job once for all the threads asking for its result
+class SharedJob:
+    def __init__(self, job):
+        self.job = job
+        self.lock = threading.Lock()
+        self.done = False
+        self.result = None
+
+    def __call__(self):
+        with self.lock:
+            if not self.done:
+                self.result = self.job()
+                self.done = True
+        return self.result
 
 
 class EnsembleModel:
     def __init__(self, flair_model, spacy_model, stanza_model,
-                 flair_model_imbalanced, spacy_model_imbalanced, stanza_model_imbalanced):
+                 flair_model_imbalanced, spacy_model_imbalanced, stanza_model_imbalanced,
+                 n_workers=1, vote_weights=None, cache_size=0, spacy_ner_only=True, cascade=None,
+                 quantized=False, share_flair_embeddings=True, share_vectors=True, mmap_vectors=True):
         # Stanza model object
         self.stanza_model = stanza.Pipeline(
             lang='en',
-            processors={'tokenize': 'spacy'},
+            processors='tokenize,ner',
             ner_model_path=stanza_model,
-            tokenize_no_ssplit=True
+            tokenize_pretokenized=True
         )
 
-        # Flair model object
-        self.flair_model = flair.load(flair_model)
+        # Flair model object, the int8 quantized version saved by the optimize command if quantized
+        load_flair = load_quantized_flair if quantized else flair_models.SequenceTagger.load
+        self.flair_model = load_flair(flair_model)
 
-        # SpaCy model object
-        self.spacy_model = spacy.load(spacy_model)
+        # SpaCy model object, with only the ner component unless spacy_ner_only is False
+        self.spacy_model = load_spacy(spacy_model, spacy_ner_only)
+        if mmap_vectors and mmap_spacy_vectors(self.spacy_model, spacy_model):
+            logger.info('Spacy vectors memory-mapped: {}'.format(spacy_model))
 
         # imbalanced
         # Stanza model object
         self.stanza_model_imbalanced = stanza.Pipeline(
             lang='en',
-            processors={'tokenize': 'spacy'},
+            processors='tokenize,ner',
             ner_model_path=stanza_model_imbalanced,
-            tokenize_no_ssplit=True
+            tokenize_pretokenized=True
         )
 
         # Flair model object
-        self.flair_model_imbalanced = flair.load(flair_model_imbalanced)
-
-        # SpaCy model object
-        self.spacy_model_imbalanced = spacy.load(spacy_model_imbalanced)
-
-    def predict(self, text, remove_extra_whitespaces=False):
+        self.flair_model_imbalanced = load_flair(flair_model_imbalanced)
+
+        # SpaCy model object. It uses the vocab and the vectors of the balanced model if they are the same
+        shared_vocab = None
+        if share_vectors and same_spacy_vectors(spacy_model, spacy_model_imbalanced):
+            shared_vocab = self.spacy_model.vocab
+            logger.info('Spacy models share the vocab and the vectors')
+        self.spacy_model_imbalanced = load_spacy(spacy_model_imbalanced, spacy_ner_only, shared_vocab)
+        if shared_vocab is None and mmap_vectors and mmap_spacy_vectors(self.spacy_model_imbalanced,
+                                                                        spacy_model_imbalanced):
+            logger.info('Spacy vectors memory-mapped: {}'.format(spacy_model_imbalanced))
+
+        # the Stanza pipelines use the int8 quantized NER models saved by the optimize command
+        if quantized:
+            load_quantized_stanza(self.stanza_model, stanza_model)
+            load_quantized_stanza(self.stanza_model_imbalanced, stanza_model_imbalanced)
+
+        # one word embedding for both Stanza NER models when they are the same
+        if share_vectors and share_stanza_word_emb(self.stanza_model, self.stanza_model_imbalanced):
+            logger.info('Stanza models share the word embedding')
+
+        # compute the BERT embeddings once for both Flair taggers when they have the same embedding weights
+        self.flair_shared_embeddings = (share_flair_embeddings and
+                                        same_flair_embeddings(self.flair_model, self.flair_model_imbalanced))
+        if share_flair_embeddings:
+            logger.info('Flair taggers share the embeddings: {}'.format(self.flair_shared_embeddings))
+
+        # worker threads to run the models in parallel. PyTorch and the spacy models release the GIL
+        # in their heavy computation, so the latency is close to the slowest single model
+        self.executor = None
+        if n_workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=n_workers)
+
+        # vote weights by model name, e.g. {'flair_imbalanced': 2}. The default weight is 1
+        vote_weights = vote_weights or {}
+        self.vote_weights = {name: vote_weights.get(name, 1) for name in VOTE_ORDER}
+        self.voter = MajorityVoter([self.vote_weights[name] for name in VOTE_ORDER])
+
+        # stages of model names, e.g. CASCADE_ORDER. The models of the later stages are skipped for the lines
+        # whose vote is already decided. None runs all the models on all the lines
+        if cascade is not None and sorted(name for stage in cascade for name in stage) != sorted(VOTE_ORDER):
+            raise Exception('The cascade must contain each model once: {}'.format(cascade))
+        self.cascade = cascade
+        self.cascade_stats = {'lines': 0,
+                              'skipped_lines': {name: 0 for name in VOTE_ORDER},
+                              'predicted_lines': {name: 0 for name in VOTE_ORDER},
+                              'seconds': {name: 0.0 for name in VOTE_ORDER}}
+
+        # LRU cache of the predictions of repeated lines. Disabled with cache_size 0
+        self.line_cache = LineCache(cache_size) if cache_size > 0 else None
+
+    def predict(self, text, remove_extra_whitespaces=False, batch_size=32, max_tokens=4096):
         # This flag will remove the extra whitespaces before predict
         if remove_extra_whitespaces:
             text = re.sub(' +', ' ', text)
 
-        def majority_vote(tag1, tag2, tag3, tag4, tag5, tag6):
-            # check the length
-            if len(tag1) != len(tag2) or len(tag1) != len(tag3):
-                raise Exception('The length of predictions different')
-            # convert BIOLU and BIOES to BIO2 format
-            stanza_preds_bio2 = to_bio2(tag1)
-            spacy_preds_bio2 = to_bio2(tag2)
-
-            stanza_preds_bio2_imbalanced = to_bio2(tag4)
-            spacy_preds_bio2_imbalanced = to_bio2(tag5)
-
-            final_tags = []
-            # flair_imbalanced is the best F1
-            tmp_tags = zip(tag6, spacy_preds_bio2, stanza_preds_bio2,
-                             tag3, spacy_preds_bio2_imbalanced, stanza_preds_bio2_imbalanced)
-            for token_tag in tmp_tags:
-                tag = Counter(list(token_tag))
-                common_tag = tag.most_common(1)[0][0]
-                final_tags.append(common_tag)
-
-            return final_tags
-
-        def predict_line(line):
-            logger.debug('Predict sentence {}'.format(line))
-            sentence = Sentence()
-            sentence.text = line
-            if line.isspace() or line == '':
-                return sentence, []
-            # spacy predict
-            logger.debug('Use Spacy')
-            doc_spacy = self.spacy_model(line)
-            preds_spacy = [token.ent_iob_
-                           if token.ent_iob_ == 'O' else (token.ent_iob_ + '-' + token.ent_type_)
-                           for token in doc_spacy]
-
-            logger.debug('Use Stanza')
-            doc_stanza = self.stanza_model.processors['tokenize'].process(line)
-            doc_stanza = self.stanza_model.processors['ner'].process(doc_stanza)
-            preds_stanza = [token.ner for sent in doc_stanza.sentences for token in sent.tokens]
-
-            # flair predict
-            flair_sentence = FlairSentence(line, use_tokenizer=build_spacy_tokenizer(self.spacy_model))
-            # token list by Spacy Tokenizer
-            tokens = [token.text for token in doc_spacy]
-
-            logger.debug('Use Flair')
-            self.flair_model.predict(flair_sentence)
-
-            preds_flair = [token.get_tag('ner').value for token in flair_sentence]
-
-            # imbalanced
-            # spacy predict
-            logger.debug('Use Spacy')
-            doc_spacy_imbalanced = self.spacy_model_imbalanced(line)
-            preds_spacy_imbalanced = [token.ent_iob_
-                                      if token.ent_iob_ == 'O' else (token.ent_iob_ + '-' + token.ent_type_)
-                                      for token in doc_spacy_imbalanced]
-
-            logger.debug('Use Stanza')
-            doc_stanza_imbalanced = self.stanza_model_imbalanced.processors['tokenize'].process(line)
-            doc_stanza_imbalanced = self.stanza_model_imbalanced.processors['ner'].process(doc_stanza_imbalanced)
-            preds_stanza_imbalanced = [token.ner for sent in doc_stanza_imbalanced.sentences for token in sent.tokens]
-
-            # flair predict
-            flair_sentence_imbalanced = FlairSentence(line,
-                                                      use_tokenizer=build_spacy_tokenizer(self.spacy_model))
-            # token list by Spacy Tokenizer
-            # tokens_imbalanced = [token.text for token in doc_spacy_imbalanced]
-
-            logger.debug('Use Flair')
-            self.flair_model_imbalanced.predict(flair_sentence_imbalanced)
-
-            preds_flair_imbalanced = [token.get_tag('ner').value for token in flair_sentence_imbalanced]
-
-            # ner_tag = majority_vote(preds_spacy, preds_stanza, preds_flair)
-            ner_tag = majority_vote(preds_stanza, preds_spacy, preds_flair,
-                                    preds_stanza_imbalanced, preds_spacy_imbalanced, preds_flair_imbalanced)
-            logger.debug('Get final tags')
-
-            # remove whitespaces from begin and end of the entity
-            if not remove_extra_whitespaces:
-                ner_tag = entity_strip(tokens, ner_tag)
-
-            # add token object into sentence
-            for i in range(len(tokens)):
-                token = Token(tokens[i], ner_tag[i])
-                sentence.add_token(token)
-
-            return sentence, list(zip(tokens, ner_tag))
-
         # split newlines to a list of text
         text_list = text.splitlines()
         # List of list of tuple (token, bio_tag). e.g. [[(token, bio_tag), (token, bio_tag)]]
@@ -152,8 +309,7 @@ class EnsembleModel:
         doc = Document()
         doc.text = text
         logger.info('Start Predicting. {} lines'.format(len(text_list)))
-        # preds_result = list(map(predict_line, text_list))
-        preds_result = [predict_line(line) for line in text_list]
+        preds_result = self.predict_lines(text_list, remove_extra_whitespaces, batch_size, max_tokens)
         logger.info('Complete Predicting.')
         for result in preds_result:
             doc.add_sentence(result[0])
@@ -161,12 +317,204 @@ class EnsembleModel:
 
         return doc, ner_preds
 
+    # predict the lines of an iterable in chunks of chunk_lines and yield the tuple (Sentence, [(token, bio_tag)])
+    # of each line. Only one chunk of lines and predictions is kept in memory
+    def predict_stream(self, lines, chunk_lines=1000, remove_extra_whitespaces=False, batch_size=32,
+                       max_tokens=4096):
+        lines = iter(lines)
+        while True:
+            chunk = list(islice(lines, chunk_lines))
+            if len(chunk) == 0:
+                break
+            # This flag will remove the extra whitespaces before predict
+            if remove_extra_whitespaces:
+                chunk = [re.sub(' +', ' ', line) for line in chunk]
+            logger.debug('Predict a chunk of {} lines'.format(len(chunk)))
+            yield from self.predict_lines(chunk, remove_extra_whitespaces, batch_size, max_tokens)
+
+    # predict a list of lines in batches of similar lengths with at most batch_size lines and max_tokens padded
+    # tokens. Empty lines are not predicted. return a list of tuple (Sentence, [(token, bio_tag)]) in the order of lines
+    def predict_lines(self, lines, remove_extra_whitespaces=False, batch_size=32, max_tokens=4096):
+        results = []
+        for line in lines:
+            sentence = Sentence()
+            sentence.text = line
+            results.append((sentence, []))
+
+        # empty lines have no tokens and are not sent to the models. Lines repeated in the list or found in the
+        # cache are not predicted again. line text -> indices of the lines to be predicted
+        pending = {}
+        for i, line in enumerate(lines):
+            if line.isspace() or line == '':
+                continue
+            token_tags = None
+            if self.line_cache is not None:
+                token_tags = self.line_cache.get((line, remove_extra_whitespaces))
+            if token_tags is not None:
+                results[i] = self.line_result(results[i][0], token_tags)
+            else:
+                pending.setdefault(line, []).append(i)
+        batch_lines = list(pending)
+        if len(batch_lines) == 0:
+            return results
+
+        # tokenize once and share the tokens with all the models
+        docs_tokens = tokenize_lines(self.spacy_model, batch_lines, batch_size)
+
+        # the models are independent until the majority vote. The tags of each model are put back in the order of lines
+        logger.debug('Use Spacy, Stanza and Flair')
+        member_preds = [[None] * len(docs_tokens) for _ in VOTE_ORDER]
+        for batch in length_batches(docs_tokens, max_tokens, batch_size):
+            for preds, batch_preds in zip(member_preds, self.predict_batch([docs_tokens[k] for k in batch])):
+                for k, tags in zip(batch, batch_preds):
+                    preds[k] = tags
+
+        # vote the tags of all the lines at once
+        ner_tags = self.voter.vote([[tag for line_tags in preds for tag in line_tags] for preds in member_preds])
+        logger.debug('Get final tags')
+
+        tag_index = 0
+        for k, line in enumerate(batch_lines):
+            # token list by Spacy Tokenizer
+            tokens = [token.text for token in docs_tokens[k]]
+            ner_tag = ner_tags[tag_index:tag_index + len(tokens)]
+            tag_index += len(tokens)
+            # remove whitespaces from begin and end of the entity
+            if not remove_extra_whitespaces:
+                ner_tag = entity_strip(tokens, ner_tag)
+
+            # tuple (token, bio_tag, start_char, end_char) of each token
+            token_tags = tuple((tokens[j], ner_tag[j], token.idx, token.idx + len(token))
+                               for j, token in enumerate(docs_tokens[k]))
+            if self.line_cache is not None:
+                self.line_cache.put((line, remove_extra_whitespaces), token_tags)
+            for i in pending[line]:
+                results[i] = self.line_result(results[i][0], token_tags)
+
+        return results
+
+    # add the tokens with their tags and character offsets into the sentence
+    # return the tuple (Sentence, [(token, bio_tag)])
+    def line_result(self, sentence, token_tags):
+        for text, tag, start_char, end_char in token_tags:
+            sentence.add_token(Token(text, tag, start_char, end_char))
+        return sentence, [(text, tag) for text, tag, _, _ in token_tags]
+
+    # hit and miss counters of the line cache
+    def cache_stats(self):
+        if self.line_cache is None:
+            return None
+        return self.line_cache.stats()
+
+    # the tags of each line by each model in the order of VOTE_ORDER
+    def predict_batch(self, docs_tokens):
+        if self.cascade is not None:
+            return self.predict_cascade(docs_tokens)
+        jobs = self.member_jobs(docs_tokens, len(docs_tokens))
+        return self.run_members([jobs[name] for name in VOTE_ORDER])
+
+    def predict_cascade(self, docs_tokens):
+        """Predict the lines with the stages of models in the cascade order
+
+        After each stage, the lines whose tokens all have a decided majority vote are not sent to
+        the models of the later stages. Those models get the leading tags of the line instead,
+        which only widen the lead, so the final vote is the same as with all the models.
+
+        Args:
+            docs_tokens: list of the token Docs of the lines
+
+        Returns:
+            the tags of each line by each model in the order of VOTE_ORDER
+        """
+        member_tags = {name: [None] * len(docs_tokens) for name in VOTE_ORDER}
+        active = list(range(len(docs_tokens)))
+        voted = []
+        self.cascade_stats['lines'] += len(docs_tokens)
+        for stage_id, stage in enumerate(self.cascade):
+            jobs = self.member_jobs([docs_tokens[k] for k in active], len(active))
+            stage_preds = self.run_members([self.timed_job(name, jobs[name], len(active)) for name in stage])
+            for name, preds in zip(stage, stage_preds):
+                for k, tags in zip(active, preds):
+                    member_tags[name][k] = tags
+            voted += stage
+
+            remaining = [name for later_stage in self.cascade[stage_id + 1:] for name in later_stage]
+            if len(remaining) == 0:
+                break
+            decided, leaders = self.voter.decided(
+                [[tag for k in active for tag in member_tags[name][k]] for name in voted],
+                [self.vote_weights[name] for name in voted],
+                sum(self.vote_weights[name] for name in remaining))
+
+            undecided = []
+            index = 0
+            for k in active:
+                n_tokens = len(member_tags[voted[0]][k])
+                if decided[index:index + n_tokens].all():
+                    for name in remaining:
+                        member_tags[name][k] = leaders[index:index + n_tokens]
+                        self.cascade_stats['skipped_lines'][name] += 1
+                else:
+                    undecided.append(k)
+                index += n_tokens
+            active = undecided
+            if len(active) == 0:
+                break
+
+        return [member_tags[name] for name in VOTE_ORDER]
+
+    # a job which adds its running time to the cascade stats
+    def timed_job(self, name, job, n_lines):
+        def run():
+            start_time = time.time()
+            preds = job()
+            self.cascade_stats['seconds'][name] += time.time() - start_time
+            self.cascade_stats['predicted_lines'][name] += n_lines
+            return preds
+        return run
+
+    # the skip rate of each model in the cascaded vote and the estimated seconds saved by the skipped lines
+    def cascade_report(self):
+        stats = self.cascade_stats
+        report = {'lines': stats['lines'], 'skip_rate': {}, 'seconds_saved': {}}
+        for name in VOTE_ORDER:
+            report['skip_rate'][name] = stats['skipped_lines'][name] / stats['lines'] if stats['lines'] > 0 else 0.0
+            seconds_per_line = (stats['seconds'][name] / stats['predicted_lines'][name]
+                                if stats['predicted_lines'][name] > 0 else 0.0)
+            report['seconds_saved'][name] = seconds_per_line * stats['skipped_lines'][name]
+        return report
+
+    # the prediction job of each model by name. A job returns the tags of each line
+    def member_jobs(self, docs_tokens, batch_size=32):
+        jobs = {
+            'spacy': lambda: spacy_tags(self.spacy_model, docs_tokens, batch_size),
+            'stanza': lambda: stanza_tags(self.stanza_model, docs_tokens),
+            'flair': lambda: flair_tags(self.flair_model, docs_tokens, batch_size),
+            'spacy_imbalanced': lambda: spacy_tags(self.spacy_model_imbalanced, docs_tokens, batch_size),
+            'stanza_imbalanced': lambda: stanza_tags(self.stanza_model_imbalanced, docs_tokens),
+            'flair_imbalanced': lambda: flair_tags(self.flair_model_imbalanced, docs_tokens, batch_size)
+        }
+        # one job predicts with both Flair taggers and embeds the lines once
+        if self.flair_shared_embeddings:
+            flair_pair = SharedJob(lambda: flair_pair_tags(self.flair_model_imbalanced, self.flair_model,
+                                                           docs_tokens, batch_size))
+            jobs['flair_imbalanced'] = lambda: flair_pair()[0]
+            jobs['flair'] = lambda: flair_pair()[1]
+        return jobs
+
+    # run the prediction jobs of the models and return their results in the order of jobs
+    def run_members(self, jobs):
+        if self.executor is None:
+            return [job() for job in jobs]
+        futures = [self.executor.submit(job) for job in jobs]
+        return [future.result() for future in futures]
+
     def evaluate(self, text, gold_tags):
         doc_text = concatenate_sents(text)
         _, pred_tags = self.predict(doc_text)
         # pred_tags include token text. Need to transfer to bio only
         pred_ner = [[token[1] for token in sent] for sent in pred_tags]
-        _, _, _, fp, fn = score_by_entity(pred_ner, gold_tags)
+        precision, recall, f1, fp, fn = score_by_entity(pred_ner, gold_tags)
         # print fp and fn
         logger.info('-------------False Positive Entities---------------')
         logger.info('Entity Number: {}'.format(len(fp)))
@@ -179,3 +527,5 @@ class EnsembleModel:
         for fn_ent in fn:
             sent_text = text[fn_ent['sent_id']]
             logger.info('Entities: {} @ {}'.format(fn_ent, sent_text))
+
+        return precision, recall, f1
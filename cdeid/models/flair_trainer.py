@@ -1,10 +1,25 @@
-from flair.data import Corpus
-from flair.datasets import ColumnCorpus
-from flair.embeddings import TokenEmbeddings, TransformerWordEmbeddings, StackedEmbeddings
-from flair.models import SequenceTagger
-from flair.trainers import ModelTrainer
 from typing import List
 from pathlib import Path
+import logging
+
+from cdeid.models.embedding_cache import EmbeddingCache
+from cdeid.utils.resources import PACKAGE_NAME
+
+logger = logging.getLogger(PACKAGE_NAME)
+
+
+# let the ModelTrainer write checkpoint.pt only after every k-th epoch. ModelTrainer.save_checkpoint pickles the
+# whole trainer, so the override is removed from the trainer while it is saved
+def checkpoint_every_k_epochs(trainer, k):
+    def save_checkpoint(model_file):
+        if trainer.epoch % k != 0:
+            return
+        del trainer.save_checkpoint
+        try:
+            trainer.save_checkpoint(model_file)
+        finally:
+            trainer.save_checkpoint = save_checkpoint
+    trainer.save_checkpoint = save_checkpoint
 
 
 class FlairTrainer:
@@ -13,12 +28,25 @@ class FlairTrainer:
                  train_file,
                  dev_file,
                  test_file,
-                 balanced=True):
+                 balanced=True,
+                 resume=False,
+                 embeddings_storage_mode='cpu',
+                 embedding_cache=True,
+                 embedding_cache_fp16=False,
+                 checkpoint_epochs=10):
         self.workspace = workspace
         self.train_file = train_file
         self.dev_file = dev_file
         self.test_file = test_file
         self.balanced = balanced
+        self.resume = resume
+        # 'none': embeddings computed in every epoch, 'cpu' or 'gpu': kept in the memory after the first epoch
+        self.embeddings_storage_mode = embeddings_storage_mode
+        # precompute the BERT embeddings of the data sets into an on-disk cache in the workspace
+        self.embedding_cache = embedding_cache
+        self.embedding_cache_fp16 = embedding_cache_fp16
+        # the number of epochs between the checkpoints, which contain the whole tagger with BERT. 0 for no checkpoint
+        self.checkpoint_epochs = checkpoint_epochs
 
     def get_work_dir(self):
         if self.balanced:
@@ -26,6 +54,13 @@ class FlairTrainer:
         return ''
 
     def train(self, batch_size=16):
+        # flair and torch are imported only when training
+        from flair.data import Corpus
+        from flair.datasets import ColumnCorpus
+        from flair.embeddings import TokenEmbeddings, TransformerWordEmbeddings, StackedEmbeddings
+        from flair.models import SequenceTagger
+        from flair.trainers import ModelTrainer
+
         # define the columns of data files
         columns = {0: 'text', 1: 'ner'}
 
@@ -38,22 +73,59 @@ class FlairTrainer:
                                       dev_file=self.dev_file,
                                       test_file=self.test_file)
 
-        tag_dictionary = corpus.make_tag_dictionary(tag_type='ner')
-        embedding_types: List[TokenEmbeddings] = [
-            TransformerWordEmbeddings('bert-base-uncased'),
-        ]
-        embeddings: StackedEmbeddings = StackedEmbeddings(embeddings=embedding_types)
+        # flair saves checkpoint.pt after each epoch. Continue from it with the epoch, optimizer and scheduler
+        checkpoint_file = model_path / 'checkpoint.pt'
+        if not self.resume and checkpoint_file.exists():
+            checkpoint_file.unlink()
+        if self.resume and checkpoint_file.exists():
+            logger.info('Resume flair training from {}'.format(checkpoint_file))
+            trainer = ModelTrainer.load_checkpoint(checkpoint_file, corpus)
+        else:
+            tag_dictionary = corpus.make_tag_dictionary(tag_type='ner')
+            embedding_types: List[TokenEmbeddings] = [
+                TransformerWordEmbeddings('bert-base-uncased'),
+            ]
+            embeddings: StackedEmbeddings = StackedEmbeddings(embeddings=embedding_types)
 
-        tagger: SequenceTagger = SequenceTagger(hidden_size=256,
-                                                dropout=0.5,
-                                                embeddings=embeddings,
-                                                tag_dictionary=tag_dictionary,
-                                                tag_type='ner',
-                                                use_crf=True)
+            tagger: SequenceTagger = SequenceTagger(hidden_size=256,
+                                                    dropout=0.5,
+                                                    embeddings=embeddings,
+                                                    tag_dictionary=tag_dictionary,
+                                                    tag_type='ner',
+                                                    use_crf=True)
 
-        trainer: ModelTrainer = ModelTrainer(tagger, corpus)
+            trainer: ModelTrainer = ModelTrainer(tagger, corpus)
+
+        if self.embedding_cache:
+            self.attach_cached_embeddings(trainer.model.embeddings, corpus, batch_size)
+
+        # flair saves a checkpoint after every epoch. Only every checkpoint_epochs-th one is written
+        if self.checkpoint_epochs > 0:
+            checkpoint_every_k_epochs(trainer, self.checkpoint_epochs)
 
         trainer.train(model_path,
                       learning_rate=0.1,
                       mini_batch_size=batch_size,
-                      max_epochs=150)
+                      max_epochs=150,
+                      embeddings_storage_mode=self.embeddings_storage_mode,
+                      checkpoint=self.checkpoint_epochs > 0)
+
+        # the checkpoint of a completed training is not resumed
+        if checkpoint_file.exists():
+            checkpoint_file.unlink()
+
+    # set the cached embeddings of the static embeddings to the sentences of the corpus. Flair does not compute
+    # the embeddings already set, and keeps them over the epochs unless embeddings_storage_mode is 'none'
+    def attach_cached_embeddings(self, embeddings, corpus, batch_size):
+        if self.embeddings_storage_mode == 'none':
+            logger.warning('Embedding cache is not used with embeddings_storage_mode none')
+            return
+        sentences = list(corpus.train) + list(corpus.dev) + list(corpus.test)
+        for embedding in embeddings.embeddings:
+            if not embedding.static_embeddings:
+                continue
+            cache_dir = Path(self.workspace) / 'embeddings' / embedding.name.replace('/', '_')
+            cache = EmbeddingCache(cache_dir, fp16=self.embedding_cache_fp16)
+            cache.update(embedding, sentences, batch_size)
+            n_found = cache.attach(embedding.name, sentences)
+            logger.info('{} cached embeddings of {} sentences'.format(embedding.name, n_found))
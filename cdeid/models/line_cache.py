@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+
+
+class LineCache:
+    """Bounded LRU cache of the predictions of the lines
+
+    Clinical notes repeat many lines verbatim, e.g. templated headers and signature blocks.
+    The predictions of a line only depend on its text and the loaded models, so the cache lives
+    with the EnsembleModel and is keyed by the line text.
+
+    Args:
+        max_size: the maximum number of lines in the cache. The least recently used lines are
+                  removed first
+    """
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # the cached value of the key, None if not cached
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        n_lookups = self.hits + self.misses
+        return {'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / n_lookups if n_lookups > 0 else 0.0}
@@ -0,0 +1,97 @@
+import numpy as np
+
+from cdeid.utils.converter import to_bio2
+
+
+class MajorityVoter:
+    """Vote the final tag of each token from the tag sequences of several models
+
+    The tags are mapped to integer ids through a label vocabulary shared by all the models
+    and stacked into an (n_models x n_tokens) matrix. The mode of every column is computed
+    with a few array operations instead of a Counter per token.
+
+    Ties go to the tag which is voted first in the order of the models, which is the same
+    result as Counter.most_common(1).
+
+    Args:
+        weights: the vote weight of each model in the order of the tag sequences.
+                 All the models have the weight 1 if not provided.
+    """
+    def __init__(self, weights=None):
+        self.weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+        # tag in BIO2, BIOES or BIOLU -> id of the BIO2 tag
+        self.tag_ids = {}
+        # id -> BIO2 tag
+        self.labels = []
+
+    def encode(self, tags):
+        ids = []
+        for tag in tags:
+            tag_id = self.tag_ids.get(tag)
+            if tag_id is None:
+                bio2_tag = to_bio2([tag])[0]
+                if bio2_tag not in self.labels:
+                    self.labels.append(bio2_tag)
+                tag_id = self.labels.index(bio2_tag)
+                self.tag_ids[tag] = tag_id
+            ids.append(tag_id)
+        return ids
+
+    def vote(self, tag_sequences):
+        n_models = len(tag_sequences)
+        weights = np.ones(n_models) if self.weights is None else self.weights
+        if len(weights) != n_models:
+            raise Exception('The number of weights is different from the number of models')
+        scores, first_votes = self.tally(tag_sequences, weights)
+        return [self.labels[tag_id] for tag_id in self.winners(scores, first_votes, n_models)]
+
+    def decided(self, tag_sequences, weights, remaining_weight):
+        """Check which tokens have the same final tag whatever the models not voted yet predict
+
+        A token is decided when its leading tag is ahead of every other tag by more than the total
+        weight of the remaining models, so no tie can be reached either.
+
+        Args:
+            tag_sequences: the tag sequences of the models voted so far
+            weights: the vote weights of these models
+            remaining_weight: the total vote weight of the models not voted yet
+
+        Returns:
+            a boolean array of the decided tokens and the list of the leading tags
+        """
+        n_models = len(tag_sequences)
+        scores, first_votes = self.tally(tag_sequences, np.asarray(weights, dtype=np.float64))
+        leaders = [self.labels[tag_id] for tag_id in self.winners(scores, first_votes, n_models)]
+        if len(self.labels) < 2:
+            margins = scores.max(axis=0) if len(self.labels) == 1 else np.zeros(0)
+        else:
+            top_two = -np.partition(-scores, 1, axis=0)[:2]
+            margins = top_two[0] - top_two[1]
+        decided = (margins > remaining_weight) & ~np.isclose(margins, remaining_weight)
+        return decided, leaders
+
+    # the weighted score of each tag id on each token, and the first model voting for it. n_models if no model
+    # votes for it
+    def tally(self, tag_sequences, weights):
+        n_models = len(tag_sequences)
+        n_tokens = len(tag_sequences[0])
+        for tags in tag_sequences:
+            if len(tags) != n_tokens:
+                raise Exception('The length of predictions different')
+
+        votes = np.array([self.encode(tags) for tags in tag_sequences], dtype=np.intp).reshape(n_models, n_tokens)
+        columns = np.arange(n_tokens)
+        scores = np.zeros((len(self.labels), n_tokens))
+        first_votes = np.full((len(self.labels), n_tokens), n_models, dtype=np.intp)
+        for m in reversed(range(n_models)):
+            scores[votes[m], columns] += weights[m]
+            first_votes[votes[m], columns] = m
+        return scores, first_votes
+
+    # the ids of the tags with the highest score, and the earliest voted one among them
+    def winners(self, scores, first_votes, n_models):
+        if scores.shape[1] == 0:
+            return []
+        candidates = np.isclose(scores, scores.max(axis=0))
+        first_votes = np.where(candidates, first_votes, n_models)
+        return first_votes.argmin(axis=0)
@@ -0,0 +1,111 @@
+# ---------------------------------------------------------------
+# Optimize the trained PyTorch models for the inference on CPU
+# ---------------------------------------------------------------
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from cdeid.data.data_loader import load_doc
+from cdeid.utils.lazy_loader import lazy_import
+from cdeid.utils.resources import PACKAGE_NAME
+
+torch = lazy_import('torch')
+stanza = lazy_import('stanza')
+flair_models = lazy_import('flair.models')
+
+logger = logging.getLogger(PACKAGE_NAME)
+
+
+# path of the quantized version of a model, e.g. best-model.pt -> best-model.int8.pt
+def quantized_path(model_path):
+    return str(Path(model_path).with_suffix('.int8.pt'))
+
+
+# quantize the weights of the LSTM and Linear layers to int8. The activations are quantized on the fly
+def quantize_module(module):
+    module.eval()
+    return torch.quantization.quantize_dynamic(module, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8)
+
+
+# the quantized modules have no float state dict, so the whole module is saved
+def save_module(module, output_file):
+    torch.save(module, output_file + '.tmp')
+    os.replace(output_file + '.tmp', output_file)
+    logger.info('Quantized model saved: {} ({:.1f} MB)'.format(output_file, os.path.getsize(output_file) / 2 ** 20))
+
+
+def quantize_flair(model_path):
+    tagger = flair_models.SequenceTagger.load(model_path)
+    save_module(quantize_module(tagger), quantized_path(model_path))
+
+
+def quantize_stanza(model_path):
+    pipeline = stanza.Pipeline(lang='en', processors='tokenize,ner', ner_model_path=model_path,
+                               tokenize_pretokenized=True)
+    trainer = pipeline.processors['ner'].trainer
+    save_module(quantize_module(trainer.model), quantized_path(model_path))
+
+
+def load_quantized_flair(model_path):
+    return torch.load(quantized_path(model_path))
+
+
+# replace the NER model of a Stanza pipeline with its quantized version
+def load_quantized_stanza(pipeline, model_path):
+    pipeline.processors['ner'].trainer.model = torch.load(quantized_path(model_path))
+    return pipeline
+
+
+def optimize_models(workspace, test_file='test.bio'):
+    """Quantize the Flair and Stanza models of the workspace and compare the ensembles on the test set
+
+    The LSTM and Linear layers, including the BERT layers of the Flair models, are dynamically
+    quantized to int8 and saved next to the models as *.int8.pt. The original and the quantized
+    ensembles predict the test set one after another, and the report of their scores, durations
+    and differences is saved to models/optimize_report.json.
+
+    Args:
+        workspace: the workspace of the trained models
+        test_file: the file name of the test set in the data directory of the workspace
+
+    Returns:
+        the report as a dict
+    """
+    # imported here, ensemble_model refers to this module
+    from cdeid.models.ensemble_model import EnsembleModel
+
+    model_dir = Path(workspace) / 'models'
+    for model_path in [model_dir / 'balanced' / 'best-model.pt', model_dir / 'best-model.pt']:
+        logger.info('Quantize flair model {}'.format(model_path))
+        quantize_flair(str(model_path))
+    for model_path in [model_dir / 'balanced' / 'stanza_model.pt', model_dir / 'stanza_model.pt']:
+        logger.info('Quantize stanza model {}'.format(model_path))
+        quantize_stanza(str(model_path))
+
+    doc_text, gold_tags = load_doc(Path(workspace) / 'data' / test_file)
+    report = {}
+    for name, quantized in [('original', False), ('quantized', True)]:
+        logger.info('Evaluate the {} ensemble model on the test set'.format(name))
+        ensemble_model = EnsembleModel(str(model_dir / 'balanced' / 'best-model.pt'),
+                                       str(model_dir / 'balanced' / 'model-best'),
+                                       str(model_dir / 'balanced' / 'stanza_model.pt'),
+                                       str(model_dir / 'best-model.pt'),
+                                       str(model_dir / 'model-best'),
+                                       str(model_dir / 'stanza_model.pt'),
+                                       quantized=quantized)
+        start_time = time.time()
+        precision, recall, f1 = ensemble_model.evaluate(doc_text, gold_tags)
+        report[name] = {'precision': precision, 'recall': recall, 'f1': f1, 'seconds': time.time() - start_time}
+        del ensemble_model
+
+    report['delta'] = {metric: report['quantized'][metric] - report['original'][metric]
+                       for metric in ['precision', 'recall', 'f1']}
+    report['speedup'] = report['original']['seconds'] / max(report['quantized']['seconds'], 1e-9)
+    logger.info('Quantized - original: precision {precision:+.4f}, recall {recall:+.4f}, f1 {f1:+.4f}'
+                .format(**report['delta']))
+    logger.info('Speedup: {:.2f}x'.format(report['speedup']))
+    with open(model_dir / 'optimize_report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
@@ -1,21 +1,57 @@
-import spacy
-from spacy.cli import download, convert, train
 from pathlib import Path
+import json
 import logging
+import os
+import shutil
 
+from cdeid.data.data_loader import read_bio, bio_tokens
+from cdeid.utils.lazy_loader import lazy_import
 from cdeid.utils.resources import PACKAGE_NAME
 
+spacy = lazy_import('spacy')
+spacy_cli = lazy_import('spacy.cli')
+spacy_gold = lazy_import('spacy.gold')
+
 logger = logging.getLogger(PACKAGE_NAME)
 
 
+# convert the BIO file to the json training file of spacy, the same as the 'ner' converter of spacy
+# with one sentence per document. The sentences are written one by one
+def bio_to_spacy_json(data_dir, file_name):
+    output_file = Path(data_dir) / Path(Path(file_name).parts[-1]).with_suffix('.json')
+    n_docs = 0
+    with open(output_file, 'w') as outfile:
+        outfile.write('[')
+        for _, lines in read_bio(Path(data_dir) / file_name, validate=False):
+            words, tags = bio_tokens(lines)
+            if len(words) == 0:
+                continue
+            if n_docs > 0:
+                outfile.write(', ')
+            biluo_tags = spacy_gold.iob_to_biluo(tags)
+            json.dump({'id': n_docs,
+                       'paragraphs': [{'sentences': [{'tokens': [{'orth': w, 'tag': '-', 'ner': t}
+                                                                 for w, t in zip(words, biluo_tags)]}]}]},
+                      outfile)
+            n_docs += 1
+        outfile.write(']')
+    logger.info('Generated json file {}.'.format(output_file))
+    return output_file
+
+
 class SpacyTrainer:
     def __init__(self,
                  workspace,
                  phi_types,
                  train_file,
                  dev_file,
-                 balanced=True):
+                 balanced=True,
+                 resume=False,
+                 ner_only_base=False):
         self.balanced = balanced
+        self.resume = resume
+        # start the training from en_core_web_lg without the tagger and the parser
+        self.ner_only_base = ner_only_base
         self.workspace = workspace
         self.phi_types = phi_types
         self.train_file = train_file
@@ -28,21 +64,20 @@ class SpacyTrainer:
 
     def convert_data(self):
         balanced = self.get_work_dir()
-        convert(Path(self.workspace) / 'data' / balanced / self.train_file,
-                Path(self.workspace) / 'data' / balanced,
-                converter='ner')
-        convert(Path(self.workspace) / 'data' / balanced / self.dev_file,
-                Path(self.workspace) / 'data' / balanced,
-                converter='ner')
+        bio_to_spacy_json(Path(self.workspace) / 'data' / balanced, self.train_file)
+        bio_to_spacy_json(Path(self.workspace) / 'data' / balanced, self.dev_file)
 
     def customize_base_mode(self):
-        if not Path(self.workspace + '/models/en_core_web_md').exists():
+        base_name = 'en_core_web_md_ner' if self.ner_only_base else 'en_core_web_md'
+        # the components not loaded are not saved into the base model
+        disable = ['tagger', 'parser'] if self.ner_only_base else []
+        if not Path(self.workspace + '/models/' + base_name).exists():
             # download en_core_web_lg model
             try:
-                en_lg_model = spacy.load('en_core_web_lg')
+                en_lg_model = spacy.load('en_core_web_lg', disable=disable)
             except:
-                download('en_core_web_lg')
-                en_lg_model = spacy.load('en_core_web_lg')
+                spacy_cli.download('en_core_web_lg')
+                en_lg_model = spacy.load('en_core_web_lg', disable=disable)
 
             # add customized NER types based on en_core_web_lg
             ner = en_lg_model.get_pipe('ner')
@@ -50,11 +85,44 @@ class SpacyTrainer:
                 ner.add_label(phi)
 
             logger.info('Customized PHI Types added into the base model: {}'.format(str(self.phi_types)))
-            en_lg_model.to_disk(Path(self.workspace) / 'models' / 'en_core_web_md')
+            # the balanced and imbalanced trainings may run at the same time. Save to a temporary
+            # directory and rename it, so the other training never reads a partly saved model
+            base_model_dir = Path(self.workspace) / 'models' / base_name
+            tmp_dir = Path(self.workspace) / 'models' / '{}.{}'.format(base_name, os.getpid())
+            en_lg_model.to_disk(tmp_dir)
+            try:
+                tmp_dir.rename(base_model_dir)
+            except OSError:
+                # saved by the other training
+                shutil.rmtree(tmp_dir)
+
+        return self.workspace + '/models/' + base_name
+
+    # the iterations model<i> saved by the spacy training runs in runs_dir/run<r>, in the order of training.
+    # The iterations whose evaluation is not saved are not completed
+    def iterations(self, runs_dir):
+        def number(path, prefix):
+            return int(path.name[len(prefix):])
 
-        return self.workspace + '/models/en_core_web_md'
+        run_dirs = sorted((path for path in Path(runs_dir).glob('run*') if path.name[len('run'):].isdigit()),
+                          key=lambda path: number(path, 'run'))
+        iterations = []
+        for run_dir in run_dirs:
+            iterations += sorted((path for path in run_dir.glob('model*')
+                                  if path.name[len('model'):].isdigit() and (path / 'accuracy.json').exists()),
+                                 key=lambda path: number(path, 'model'))
+        return iterations
 
-    def train(self):
+    # the iteration with the best NER scores over all the runs, compared as spacy selects model-best
+    def best_iteration(self, iterations):
+        def scores(path):
+            with open(path / 'accuracy.json', 'r') as f:
+                accuracy = json.load(f)
+            return [accuracy.get(metric, 0.0) for metric in ['ents_f', 'ents_p', 'ents_r']]
+
+        return max(iterations, key=scores, default=None)
+
+    def train(self, n_iter=30):
         logger.info('Convert training data')
         self.convert_data()
         logger.info('Customize base model')
@@ -64,5 +132,36 @@ class SpacyTrainer:
         train_file = Path(Path(self.train_file).parts[-1]).with_suffix('.json')
         dev_file = Path(Path(self.dev_file).parts[-1]).with_suffix('.json')
 
-        train('en', model_path, data_dir / train_file,
-              data_dir / dev_file, base_model=base_model, pipeline='ner')
+        # each run of spacy train saves its iterations into a new directory of runs_dir, so a resumed
+        # training continues from the last iteration of all the runs for the remaining iterations
+        runs_dir = model_path / 'spacy_runs'
+        if not self.resume and runs_dir.exists():
+            shutil.rmtree(runs_dir)
+        iterations = self.iterations(runs_dir)
+        if len(iterations) > 0:
+            base_model = str(iterations[-1])
+            logger.info('Resume spacy training from {} for {} iterations'
+                        .format(base_model, max(n_iter - len(iterations), 0)))
+
+        if n_iter > len(iterations):
+            run_dir = runs_dir / 'run{}'.format(len(list(runs_dir.glob('run*'))) if runs_dir.exists() else 0)
+            spacy_cli.train('en', run_dir, data_dir / train_file,
+                            data_dir / dev_file, base_model=base_model, pipeline='ner',
+                            n_iter=n_iter - len(iterations))
+
+        # the best iteration of all the runs is the model used by the ensemble
+        best_iteration = self.best_iteration(self.iterations(runs_dir))
+        if best_iteration is None:
+            raise Exception('No spacy model trained in {}'.format(runs_dir))
+        logger.info('Best spacy model: {}'.format(best_iteration))
+        best_model_dir = model_path / 'model-best'
+        tmp_dir = model_path / 'model-best.tmp'
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        shutil.copytree(best_iteration, tmp_dir)
+        if best_model_dir.exists():
+            shutil.rmtree(best_model_dir)
+        tmp_dir.rename(best_model_dir)
+
+        # the iterations of a completed training are not resumed
+        shutil.rmtree(runs_dir)
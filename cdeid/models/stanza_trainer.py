@@ -1,27 +1,31 @@
-from stanza.utils.prepare_ner_data import load_conll03
 from pathlib import Path
 import json
 import logging
-import cdeid.models.stanza_trainer_agent as stanza_agent
+from cdeid.data.data_loader import read_bio, bio_tokens
+from cdeid.utils.lazy_loader import lazy_import
 from cdeid.utils.resources import PACKAGE_NAME
 
+stanza_agent = lazy_import('cdeid.models.stanza_trainer_agent')
+
 logger = logging.getLogger(PACKAGE_NAME)
 
 
+# convert the BIO file to the json file of stanza. The sentences are written one by one
 def bio_to_json(data_dir, file_name):
-    sentences = load_conll03(Path(data_dir) / file_name)
-    logger.info("{} examples loaded from {}".format(len(sentences), Path(data_dir) / file_name))
-
-    document = []
-    for (words, tags) in sentences:
-        sent = []
-        for w, t in zip(words, tags):
-            sent += [{'text': w, 'ner': t}]
-        document += [sent]
-
     output_file_name = 'stanza_' + str(Path(Path(file_name).parts[-1]).with_suffix('.json'))
+    n_sentences = 0
     with open(Path(data_dir) / output_file_name, 'w') as outfile:
-        json.dump(document, outfile)
+        outfile.write('[')
+        for _, lines in read_bio(Path(data_dir) / file_name, validate=False):
+            words, tags = bio_tokens(lines)
+            if len(words) == 0:
+                continue
+            if n_sentences > 0:
+                outfile.write(', ')
+            json.dump([{'text': w, 'ner': t} for w, t in zip(words, tags)], outfile)
+            n_sentences += 1
+        outfile.write(']')
+    logger.info("{} examples loaded from {}".format(n_sentences, Path(data_dir) / file_name))
     logger.info("Generated json file {}.".format(Path(data_dir) / output_file_name))
     return output_file_name
 
@@ -32,12 +36,17 @@ class StanzaTrainer:
                  train_file,
                  dev_file,
                  wordvec_file,
-                 balanced=True):
+                 balanced=True,
+                 resume=False,
+                 checkpoint_interval=500):
         self.workspace = workspace
         self.train_file = train_file
         self.dev_file = dev_file
         self.wordvec_file = wordvec_file
         self.balanced = balanced
+        self.resume = resume
+        # the number of steps between the checkpoints to resume the training. 0 for no checkpoint
+        self.checkpoint_interval = checkpoint_interval
 
     def get_work_dir(self):
         if self.balanced:
@@ -70,6 +79,15 @@ class StanzaTrainer:
 
         args = ['--train_file', str(data_dir / train_file_name), '--eval_file', str(data_dir / dev_file_name),
                 '--lang', 'en', '--mode', 'train', '--wordvec_file', wordvec_path, '--save_dir', str(model_path),
-                '--save_name', 'stanza_model.pt', '--batch_size', '16', '--lr', '0.1', '--dropout', '0.5']
+                '--save_name', 'stanza_model.pt', '--batch_size', '16', '--lr', '0.1', '--dropout', '0.5',
+                '--checkpoint_interval', str(self.checkpoint_interval)]
+        # the checkpoint of a previous training is only used when resuming, and removed when the training completes
+        checkpoint_file = model_path / 'stanza_model.pt.checkpoint'
+        if self.resume:
+            args += ['--resume']
+        elif checkpoint_file.exists():
+            checkpoint_file.unlink()
 
         stanza_agent.main(args)
+        if checkpoint_file.exists():
+            checkpoint_file.unlink()
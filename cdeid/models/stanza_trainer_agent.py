@@ -104,11 +104,16 @@ def parse_args(arguments):
     parser.add_argument('--log_step', type=int, default=20, help='Print log every k steps.')
     parser.add_argument('--save_dir', type=str, default='saved_models/ner', help='Root dir for saving models.')
     parser.add_argument('--save_name', type=str, default=None, help="File name to save the model")
+    parser.add_argument('--checkpoint_interval', type=int, default=500,
+                        help='Save a checkpoint to resume the training every k steps. 0 for no checkpoint.')
+    parser.add_argument('--resume', action='store_true', help='Resume the training from the last checkpoint.')
 
     parser.add_argument('--seed', type=int, default=1234)
     parser.add_argument('--cuda', type=bool, default=torch.cuda.is_available())
     parser.add_argument('--cpu', action='store_true', help='Ignore CUDA.')
     args = parser.parse_args(arguments)
+    if args.checkpoint_interval < 0:
+        parser.error('--checkpoint_interval must be 0 or more')
     return args
 
 
@@ -189,6 +194,13 @@ def train(args):
     else:
         scheduler = None
 
+    # resume from the last checkpoint
+    checkpoint_file = model_file + '.checkpoint'
+    if args['resume'] and os.path.exists(checkpoint_file):
+        global_step, dev_score_history = load_checkpoint(checkpoint_file, trainer, scheduler)
+        current_lr = trainer.optimizer.param_groups[0]['lr']
+        logger.info("Resume training from step {} of {}".format(global_step, checkpoint_file))
+
     # start training
     train_loss = 0
     while True:
@@ -230,6 +242,9 @@ def train(args):
                 if scheduler is not None:
                     scheduler.step(dev_score)
 
+            if args['checkpoint_interval'] > 0 and global_step % args['checkpoint_interval'] == 0:
+                save_checkpoint(checkpoint_file, trainer, scheduler, global_step, dev_score_history)
+
             # check stopping
             current_lr = trainer.optimizer.param_groups[0]['lr']
             if global_step >= args['max_steps'] or current_lr <= args['min_lr']:
@@ -247,6 +262,36 @@ def train(args):
     logger.info("Best dev F1 = {:.2f}, at iteration = {}".format(best_f, best_eval * args['eval_interval']))
 
 
+# save the states of model, optimizer, lr scheduler and random generators to resume the training
+def save_checkpoint(checkpoint_file, trainer, scheduler, global_step, dev_score_history):
+    checkpoint = {
+        'model': trainer.model.state_dict(),
+        'optimizer': trainer.optimizer.state_dict(),
+        'scheduler': scheduler.state_dict() if scheduler is not None else None,
+        'global_step': global_step,
+        'dev_score_history': dev_score_history,
+        'random_state': random.getstate(),
+        'numpy_random_state': np.random.get_state(),
+        'torch_random_state': torch.get_rng_state()
+    }
+    # replace the previous checkpoint only when the new one is completely saved
+    torch.save(checkpoint, checkpoint_file + '.tmp')
+    os.replace(checkpoint_file + '.tmp', checkpoint_file)
+    logger.info("Checkpoint saved at step {}.".format(global_step))
+
+
+def load_checkpoint(checkpoint_file, trainer, scheduler):
+    checkpoint = torch.load(checkpoint_file, lambda storage, loc: storage)
+    trainer.model.load_state_dict(checkpoint['model'])
+    trainer.optimizer.load_state_dict(checkpoint['optimizer'])
+    if scheduler is not None and checkpoint['scheduler'] is not None:
+        scheduler.load_state_dict(checkpoint['scheduler'])
+    random.setstate(checkpoint['random_state'])
+    np.random.set_state(checkpoint['numpy_random_state'])
+    torch.set_rng_state(checkpoint['torch_random_state'])
+    return checkpoint['global_step'], checkpoint['dev_score_history']
+
+
 def evaluate(args):
     # file paths
     model_file = args['save_dir'] + '/' + args['save_name'] if args['save_name'] is not None \
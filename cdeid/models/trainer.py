@@ -5,6 +5,10 @@
 # Released under Apache License 2.0
 # ---------------------------------------------------------------
 import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
 from pathlib import Path
 from shutil import copyfile
 
@@ -13,12 +17,51 @@ from cdeid.models.ensemble_model import EnsembleModel
 from cdeid.models.flair_trainer import FlairTrainer
 from cdeid.models.spacy_trainer import SpacyTrainer
 from cdeid.models.stanza_trainer import StanzaTrainer
-from cdeid.data.data_operator import pass_bio_checking, sample_data_lines, parse_documents, load_data
+from cdeid.data.data_operator import sample_data_lines
 from cdeid.utils.resources import PROGRESS_STATUS, PACKAGE_NAME
 
 logger = logging.getLogger(PACKAGE_NAME)
 
 
+# training steps: step -> (method of Trainer, the steps it depends on)
+TRAIN_STEPS = {
+    1: ('prepare_datasets', ()),
+    2: ('train_spacy_balanced', (1,)),
+    3: ('train_stanza_balanced', (1,)),
+    4: ('train_flair_balanced', (1,)),
+    5: ('train_spacy_imbalanced', (1,)),
+    6: ('train_stanza_imbalanced', (1,)),
+    7: ('train_flair_imbalanced', (1,)),
+    8: ('ensemble_models', (2, 3, 4, 5, 6, 7))
+}
+
+
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+
+
+# limit the threads of the numeric libraries in the training processes started in this context.
+# The spawned processes inherit the environment, so the limits are set before they load numpy or torch
+@contextmanager
+def train_threads(n_threads):
+    previous = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    if n_threads is not None:
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(n_threads)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+# run a training step in a training process
+def _run_train_step(trainer, method):
+    getattr(trainer, method)()
+
+
 class Trainer:
     def __init__(self,
                  data_dir,
@@ -28,7 +71,14 @@ class Trainer:
                  resume_training=False,
                  train_file='train.bio',
                  dev_file='dev.bio',
-                 test_file='test.bio'
+                 test_file='test.bio',
+                 n_jobs=1,
+                 threads_per_job=None,
+                 flair_storage_mode='cpu',
+                 embedding_cache=True,
+                 embedding_cache_fp16=False,
+                 spacy_ner_only_base=False,
+                 flair_checkpoint_epochs=10
                  ):
         self.data_dir = Path(data_dir)
         if not self.data_dir.exists():
@@ -44,11 +94,26 @@ class Trainer:
         self.dev_file = dev_file
         self.test_file = test_file
 
+        # the number of training steps running in parallel processes and the threads of each process
+        self.n_jobs = n_jobs
+        self.threads_per_job = threads_per_job
+
+        # how the BERT embeddings of the flair trainings are stored and cached
+        self.flair_storage_mode = flair_storage_mode
+        self.embedding_cache = embedding_cache
+        self.embedding_cache_fp16 = embedding_cache_fp16
+        # the number of epochs between the checkpoints of the flair trainings
+        self.flair_checkpoint_epochs = flair_checkpoint_epochs
+
+        # train the spacy models from a base model without the tagger and the parser
+        self.spacy_ner_only_base = spacy_ner_only_base
+
     def train(self):
         """Train the models using the provided corpus
 
         Load the corpus of training and development and train models on balanced and
-        imbalanced data sets.
+        imbalanced data sets. The steps run as soon as the steps they depend on are completed.
+        With n_jobs > 1, the independent model trainings run in separate processes.
 
         Args:
 
@@ -58,66 +123,77 @@ class Trainer:
         # prepare workspace
         self.prepare_workspace()
 
-        # 0. check the status of training in the .status file in the workspace
-        status_flags = [1] * 8
-
+        # 0. check the completed steps by their markers in the workspace
         if not self.resume:
             logger.info('A new training process is starting')
+            for step in TRAIN_STEPS:
+                self.clear_step_done(step)
+            done = set()
         else:
-            status = self.check_train_status()
-            if status - 1:
-                for i in range(0, status - 1):
-                    status_flags[i] = 0
-
-            logger.info('Resume the previous training process at the step {} - {}'
-                        .format(status, PROGRESS_STATUS[status]))
+            done = {step for step in TRAIN_STEPS if self.is_step_done(step)}
+            pending = [step for step in TRAIN_STEPS if step not in done]
+            if len(pending) == 0:
+                logger.info('Resume the previous training process: {}'.format(PROGRESS_STATUS[9]))
+            else:
+                logger.info('Resume the previous training process at the steps {}'
+                            .format(', '.join('{} - {}'.format(step, PROGRESS_STATUS[step]) for step in pending)))
 
         # Process training
-        if status_flags[0]:
-            self.prepare_datasets()
-
-        if status_flags[1]:
-            self.train_spacy_balanced()
-
-        if status_flags[2]:
-            self.train_stanza_balanced()
-
-        if status_flags[3]:
-            self.train_flair_balanced()
-
-        if status_flags[4]:
-            self.train_spacy_imbalanced()
-
-        if status_flags[5]:
-            self.train_stanza_imbalanced()
-
-        if status_flags[6]:
-            self.train_flair_imbalanced()
-
-        if status_flags[7]:
-            self.ensemble_models()
-
-    # check train status. Status stored in .status file in workspace with a status number
-    def check_train_status(self):
-        status_file = open(Path(self.workspace) / '.status', 'r')
-        status = status_file.readline()
-        status_file.close()
-        if len(status.strip()) == 0:
-            return 1
-        return int(status)
-
-    # 1-prepare data sets
-    # 2-train spacy on balanced sets
-    # 3-train stanza on balanced sets
-    # 4-train flair on balanced sets
-    # 5-train spacy on imbalanced sets
-    # 6-train stanza on imbalanced sets
-    # 7-train flair on imbalanced sets
-    # 8-ensemble model
-    def update_train_status(self, status):
-        status_file = open(Path(self.workspace) / '.status', 'w')
-        status_file.write(str(status))
-        status_file.close()
+        if self.n_jobs > 1:
+            self.run_steps_parallel(done)
+        else:
+            for step, (method, _) in TRAIN_STEPS.items():
+                if step not in done:
+                    getattr(self, method)()
+                    self.mark_step_done(step)
+
+    def run_steps_parallel(self, done):
+        running = {}
+        error = None
+        context = multiprocessing.get_context('spawn')
+        with train_threads(self.threads_per_job), \
+                ProcessPoolExecutor(max_workers=self.n_jobs, mp_context=context) as executor:
+            while True:
+                # at most n_jobs steps are submitted, so no step waits in the queue of the executor.
+                # No new step starts after a failure, the running steps are completed
+                if error is None:
+                    for step, (method, depends) in TRAIN_STEPS.items():
+                        if len(running) >= self.n_jobs:
+                            break
+                        if step not in done and step not in running.values() and all(d in done for d in depends):
+                            running[executor.submit(_run_train_step, self, method)] = step
+                if len(running) == 0:
+                    break
+
+                completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    step = running.pop(future)
+                    if future.exception() is not None:
+                        logger.error('Training step {} - {} - failed: {}'
+                                     .format(step, PROGRESS_STATUS[step], future.exception()))
+                        error = error or future.exception()
+                    else:
+                        self.mark_step_done(step)
+                        done.add(step)
+
+        # raise the error of the first failed step. The completed steps are kept for resuming
+        if error is not None:
+            raise error
+
+    # each completed step has a marker file .steps/<step>.done in workspace
+    def step_marker(self, step):
+        return Path(self.workspace) / '.steps' / '{}.done'.format(step)
+
+    def is_step_done(self, step):
+        return self.step_marker(step).exists()
+
+    def mark_step_done(self, step):
+        self.step_marker(step).touch()
+        logger.info('Training step {} - {} - marked as completed'.format(step, PROGRESS_STATUS[step]))
+
+    def clear_step_done(self, step):
+        if self.step_marker(step).exists():
+            self.step_marker(step).unlink()
 
     # 0-prepare workspace directory
     def prepare_workspace(self):
@@ -133,15 +209,20 @@ class Trainer:
         if not data_dir.exists():
             data_dir.mkdir()
 
-        status_file = Path(self.workspace) / '.status'
-        if not status_file.is_file():
-            status_file.touch()
+        steps_dir = Path(self.workspace) / '.steps'
+        if not steps_dir.exists():
+            steps_dir.mkdir()
+            # convert the status of the previous version: the steps before the status are completed
+            status_file = Path(self.workspace) / '.status'
+            if status_file.is_file():
+                status = status_file.read_text().strip()
+                for step in range(1, int(status) if len(status) != 0 else 1):
+                    self.step_marker(step).touch()
 
         logger.info('workspace prepared: models and data directories are ready')
 
     # 1-prepare balanced and imbalanced training and dev data sets
     def prepare_datasets(self):
-        self.update_train_status(1)
         logger.info('Training step 1 - prepare data sets - started')
         data_dir = Path(self.workspace) / 'data'
         # if not data_dir.exists():
@@ -150,25 +231,15 @@ class Trainer:
         copyfile(self.data_dir / self.train_file, data_dir / self.train_file)
         copyfile(self.data_dir / self.dev_file, data_dir / self.dev_file)
         copyfile(self.data_dir / self.test_file, data_dir / self.test_file)
-        # load data from files
-        train = load_data(data_dir / self.train_file)
-        if not pass_bio_checking(train):
-            raise Exception('Please check the BIO format in the file {}'.format(self.train_file))
-
-        dev = load_data(data_dir / self.dev_file)
-        if not pass_bio_checking(dev):
-            raise Exception('Please check the BIO format in the file {}'.format(self.dev_file))
-
-        # parse data to list of lists for sampling the balanced data sets
-        train_doc = parse_documents(train)
-        logger.info('Training set: {} lines'.format(sum([len(doc) for doc in train_doc])))
-        # generate balanced data sets
-        train_balanced_size, _ = sample_data_lines(train_doc, 1.0, data_dir / 'balanced', self.train_file)
+        # check the BIO format and sample the balanced data sets from files
+        logger.info('Training set: {}'.format(self.train_file))
+        train_balanced_size, _ = sample_data_lines(data_dir / self.train_file,
+                                                   1.0, data_dir / 'balanced', self.train_file)
         logger.info('Training balanced set: {} lines'.format(train_balanced_size))
 
-        dev_doc = parse_documents(dev)
-        logger.info('Dev set: {} lines'.format(sum([len(doc) for doc in dev_doc])))
-        dev_balanced_size, _ = sample_data_lines(dev_doc, 1.0, data_dir / 'balanced', self.dev_file)
+        logger.info('Dev set: {}'.format(self.dev_file))
+        dev_balanced_size, _ = sample_data_lines(data_dir / self.dev_file,
+                                                 1.0, data_dir / 'balanced', self.dev_file)
         logger.info('Dev balanced set: {} lines'.format(dev_balanced_size))
 
         copyfile(self.data_dir / self.test_file, data_dir / 'balanced' / self.test_file)
@@ -177,56 +248,64 @@ class Trainer:
 
     # 2-train spaCy model on balanced training and dev data sets
     def train_spacy_balanced(self):
-        self.update_train_status(2)
         logger.info('Training step 2 - train spacy on balanced sets - started')
-        spacy_trainer = SpacyTrainer(self.workspace, self.phi_types, self.train_file, self.dev_file)
+        spacy_trainer = SpacyTrainer(self.workspace, self.phi_types, self.train_file, self.dev_file,
+                                     resume=self.resume, ner_only_base=self.spacy_ner_only_base)
         spacy_trainer.train()
         logger.info('Training step 2 - train spacy on balanced sets - completed')
 
     # 3-train Stanza model on balanced training and dev data sets
     def train_stanza_balanced(self):
-        self.update_train_status(3)
         logger.info('Training step 3 - train stanza on balanced sets - started')
-        stanza_trainer = StanzaTrainer(self.workspace, self.train_file, self.dev_file, self.wordvec_file)
+        stanza_trainer = StanzaTrainer(self.workspace, self.train_file, self.dev_file, self.wordvec_file,
+                                       resume=self.resume)
         stanza_trainer.train()
         logger.info('Training step 3 - train stanza on balanced sets - completed')
 
     # 4-train FLAIR model on balanced training and dev data sets
     def train_flair_balanced(self):
-        self.update_train_status(4)
         logger.info('Training step 4 - train flair on balanced sets - started')
-        flair_trainer = FlairTrainer(self.workspace, self.train_file, self.dev_file, self.test_file)
+        flair_trainer = FlairTrainer(self.workspace, self.train_file, self.dev_file, self.test_file,
+                                     resume=self.resume,
+                                     embeddings_storage_mode=self.flair_storage_mode,
+                                     embedding_cache=self.embedding_cache,
+                                     embedding_cache_fp16=self.embedding_cache_fp16,
+                                     checkpoint_epochs=self.flair_checkpoint_epochs)
         flair_trainer.train()
         logger.info('Training step 4 - train flair on balanced sets - completed')
 
     # 5-train spaCy model on imbalanced training and dev data sets
     def train_spacy_imbalanced(self):
-        self.update_train_status(5)
         logger.info('Training step 5 - train spacy on imbalanced sets - started')
-        spacy_trainer = SpacyTrainer(self.workspace, self.phi_types, self.train_file, self.dev_file, balanced=False)
+        spacy_trainer = SpacyTrainer(self.workspace, self.phi_types, self.train_file, self.dev_file,
+                                     balanced=False, resume=self.resume,
+                                     ner_only_base=self.spacy_ner_only_base)
         spacy_trainer.train()
         logger.info('Training step 5 - train spacy on imbalanced sets - completed')
 
     # 6-train Stanza model on imbalanced training and dev data sets
     def train_stanza_imbalanced(self):
-        self.update_train_status(6)
         logger.info('Training step 6 - train stanza on imbalanced sets - started')
         stanza_trainer = StanzaTrainer(self.workspace,
-                                       self.train_file, self.dev_file, self.wordvec_file, balanced=False)
+                                       self.train_file, self.dev_file, self.wordvec_file,
+                                       balanced=False, resume=self.resume)
         stanza_trainer.train()
         logger.info('Training step 6 - train stanza on imbalanced sets - completed')
 
     # 7-train FLAIR model on imbalanced training and dev data sets
     def train_flair_imbalanced(self):
-        self.update_train_status(7)
         logger.info('Training step 7 - train flair on imbalanced sets - started')
-        flair_trainer = FlairTrainer(self.workspace, self.train_file, self.dev_file, self.test_file, balanced=False)
+        flair_trainer = FlairTrainer(self.workspace, self.train_file, self.dev_file, self.test_file,
+                                     balanced=False, resume=self.resume,
+                                     embeddings_storage_mode=self.flair_storage_mode,
+                                     embedding_cache=self.embedding_cache,
+                                     embedding_cache_fp16=self.embedding_cache_fp16,
+                                     checkpoint_epochs=self.flair_checkpoint_epochs)
         flair_trainer.train(batch_size=64)
         logger.info('Training step 7 - train flair on imbalanced sets - completed')
 
     # 8-ensemble models
     def ensemble_models(self):
-        self.update_train_status(8)
         logger.info('Training step 8 - ensemble model - started')
         logger.info('Evaluate the ensemble model on the test set')
         model_dir = Path(self.workspace) / 'models'
@@ -243,5 +322,3 @@ class Trainer:
         # ensemble_model.evaluate_with_batch(doc_text, gold_tags, batch_size=64)
 
         logger.info('Training step 8 - ensemble model - completed')
-        # mark the training process as completed
-        self.update_train_status(9)
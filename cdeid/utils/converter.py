@@ -1,9 +1,11 @@
-import spacy
+from cdeid.utils.lazy_loader import lazy_import, load_model
 from cdeid.utils.resources import *
 
+spacy = lazy_import('spacy')
+
 
 def ent_tuple_to_bio(sentences, bio_scheme=BIO_SCHEME_2):
-    nlp = spacy.load('en_core_web_sm')
+    nlp = load_model('en_core_web_sm', lambda: spacy.load('en_core_web_sm'))
     tokens_list = []
     tokens_bio_list = []
     for record_txt, record_entities in sentences:
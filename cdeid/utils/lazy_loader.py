@@ -0,0 +1,48 @@
+import importlib
+import logging
+import threading
+
+from cdeid.utils.resources import PACKAGE_NAME
+
+logger = logging.getLogger(PACKAGE_NAME)
+
+
+class LazyModule:
+    """A module which is imported on the first access of its attributes
+
+    spaCy, Stanza, Flair and PyTorch take seconds to import. Modules of this package refer to
+    them through LazyModule so that importing the package, the command line help and the commands
+    only pay for the toolkits they use.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return '<lazy module {}>'.format(self._name)
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+# registry of the models loaded on their first use
+_models = {}
+_models_lock = threading.RLock()
+
+
+# load a model on the first use and share it afterwards. The loader is called only once for a key
+def load_model(key, loader):
+    with _models_lock:
+        if key not in _models:
+            logger.info('Loading model {}'.format(key))
+            _models[key] = loader()
+        return _models[key]
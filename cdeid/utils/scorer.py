@@ -26,16 +26,21 @@ def score_by_entity(pred_tag_sequences, gold_tag_sequences, verbose=True):
         "Number of predicted tag sequences does not match gold sequences."
 
     def decode_all(tag_sequences):
-        # decode from all sequences, each sequence with a unique id
+        # decode from all sequences, each sequence with a unique id.
+        # entity is a hashable tuple (sent_id, start, end, type)
         ents = []
         for sent_id, tags in enumerate(tag_sequences):
             for ent in decode_from_bio2(tags):
-                ent['sent_id'] = sent_id
-                ents += [ent]
+                ents.append((sent_id, ent['start'], ent['end'], ent['type']))
         return ents
 
+    def to_dict(ent):
+        return {'start': ent[1], 'end': ent[2], 'type': ent[3], 'sent_id': ent[0]}
+
     gold_ents = decode_all(gold_tag_sequences)
     pred_ents = decode_all(pred_tag_sequences)
+    gold_set = set(gold_ents)
+    pred_set = set(pred_ents)
 
     correct_by_type = Counter()
     guessed_by_type = Counter()
@@ -48,25 +53,22 @@ def score_by_entity(pred_tag_sequences, gold_tag_sequences, verbose=True):
     fp = []
     fn = []
     for p in pred_ents:
-        if p not in gold_ents:
-            fp.append(p)
-    for p in gold_ents:
-        if p not in pred_ents:
-            fn.append(p)
+        guessed_by_type[p[3]] += 1
+        if p in gold_set:
+            correct_by_type[p[3]] += 1
+        else:
+            fp.append(to_dict(p))
+    for g in gold_ents:
+        gold_by_type[g[3]] += 1
+        entities.add(g[3])
+        if g not in pred_set:
+            fn.append(to_dict(g))
 
     logger.info('Predict entities in total: {}'.format(len(pred_ents)))
     logger.info('Gold entities in total: {}'.format(len(gold_ents)))
     logger.info('False Positive: {}'.format(len(fp)))
     logger.info('False Negative: {}'.format(len(fn)))
 
-    for p in pred_ents:
-        guessed_by_type[p['type']] += 1
-        if p in gold_ents:
-            correct_by_type[p['type']] += 1
-    for g in gold_ents:
-        gold_by_type[g['type']] += 1
-        entities.add(g['type'])
-
     prec_micro = 0.0
     if sum(guessed_by_type.values()) > 0:
         prec_micro = sum(correct_by_type.values()) * 1.0 / sum(guessed_by_type.values())
@@ -0,0 +1,14 @@
+from operator import itemgetter
+
+
+# render the entities (start_idx, end_idx, type) of a text in one pass.
+# replace(words, entity_type) returns the string written in place of the words of an entity
+def render_spans(text, entities, replace):
+    pieces = []
+    last_idx = 0
+    for start_idx, end_idx, entity_type in sorted(entities, key=itemgetter(0)):
+        pieces.append(text[last_idx:start_idx])
+        pieces.append(replace(text[start_idx:end_idx], entity_type))
+        last_idx = end_idx
+    pieces.append(text[last_idx:])
+    return ''.join(pieces)
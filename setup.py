@@ -20,7 +20,8 @@ setup(
         'spaCy>=2.3.2',
         'stanza>=1.1.1',
         'flair==0.8',
-        'mako>=1.1.3'
+        'mako>=1.1.3',
+        'numpy'
     ],
     packages=find_packages(exclude=('tests', 'docs')),
     classifiers=[
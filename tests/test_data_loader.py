@@ -0,0 +1,54 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from cdeid.data.data_loader import bio_tokens, load_doc, read_bio
+
+BIO_TEXT = '''-DOCSTART- -X- O O
+
+Seen O
+by O
+John B-NAME
+Smith I-NAME
+
+on O
+Monday B-DATE
+
+-DOCSTART- -X- O O
+
+-DOCSTART- -X- O O
+Call O
+0412 B-PHONE'''
+
+
+class ReadBioTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+
+    def write_bio(self, text):
+        data_file = Path(self.data_dir) / 'data.bio'
+        data_file.write_text(text)
+        return str(data_file)
+
+    def test_sentences_of_documents(self):
+        sentences = list(read_bio(self.write_bio(BIO_TEXT)))
+        self.assertEqual([doc_id for doc_id, _ in sentences], [0, 0, 1])
+        self.assertEqual(sentences[0][1], ['Seen O\n', 'by O\n', 'John B-NAME\n', 'Smith I-NAME\n'])
+        # the last line without newline
+        self.assertEqual(sentences[2][1], ['Call O\n', '0412 B-PHONE\n'])
+
+    def test_invalid_tag_line_number(self):
+        data_file = self.write_bio('Seen O\nby O\n\nJohn NAME\n')
+        with self.assertRaisesRegex(Exception, 'at line 4: John NAME'):
+            list(read_bio(data_file))
+        self.assertEqual(len(list(read_bio(data_file, validate=False))), 2)
+
+    def test_load_doc(self):
+        sents, ner_tags = load_doc(self.write_bio(BIO_TEXT))
+        self.assertEqual(sents, [['Seen', 'by', 'John', 'Smith'], ['on', 'Monday'], ['Call', '0412']])
+        self.assertEqual(ner_tags, [['O', 'O', 'B-NAME', 'I-NAME'], ['O', 'B-DATE'], ['O', 'B-PHONE']])
+
+    def test_bio_tokens_use_first_and_last_columns(self):
+        self.assertEqual(bio_tokens(['John NNP B-NER B-NAME\n', 'x\n']), (['John'], ['B-NAME']))
@@ -0,0 +1,54 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from cdeid.data.data_loader import read_bio
+from cdeid.data.data_operator import has_phi, sample_data_lines, sample_data_proportions
+
+
+class SampleDataTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.data_dir))
+        # 10 sentences with PHI and 50 without
+        sentences = []
+        for i in range(60):
+            tag = 'B-NAME' if i % 6 == 0 else 'O'
+            sentences.append('line{} O\nword{} {}\n'.format(i, i, tag))
+        self.data_file = self.data_dir / 'train.bio'
+        self.data_file.write_text('\n'.join(sentences))
+
+    def sampled(self, output_dir):
+        return [''.join(lines) for _, lines in read_bio(str(Path(output_dir) / 'train.bio'))]
+
+    def test_proportions(self):
+        output_dirs = {proportion: str(self.data_dir / str(proportion)) for proportion in [1.0, 1.5, 2.0, 4.0, 10.0]}
+        sizes = sample_data_proportions(str(self.data_file), output_dirs, 'train.bio')
+        self.assertEqual(sizes, {1.0: (20, 10), 1.5: (25, 10), 2.0: (30, 10), 4.0: (50, 10), 10.0: (60, 10)})
+
+        all_lines = [''.join(lines) for _, lines in read_bio(str(self.data_file))]
+        previous = set()
+        for proportion, output_dir in output_dirs.items():
+            sampled = self.sampled(output_dir)
+            self.assertEqual(len(sampled), sizes[proportion][0])
+            self.assertEqual(sum(has_phi(line.splitlines()) for line in sampled), 10)
+            # the lines keep the order of the data file
+            self.assertEqual(sampled, [line for line in all_lines if line in sampled])
+            # the samples of the smaller proportions are in the larger ones
+            self.assertTrue(previous <= set(sampled))
+            previous = set(sampled)
+
+    def test_reproducible(self):
+        samples = []
+        for seed in [2020, 2020, 7]:
+            output_dir = str(self.data_dir / 'sample')
+            sample_data_proportions(str(self.data_file), {1.0: output_dir}, 'train.bio', seed)
+            samples.append(self.sampled(output_dir))
+        self.assertEqual(samples[0], samples[1])
+        self.assertNotEqual(samples[0], samples[2])
+
+    def test_sample_data_lines(self):
+        output_dir = str(self.data_dir / 'balanced')
+        self.assertEqual(sample_data_lines(str(self.data_file), 2.0, output_dir, 'train.bio'), (30, 10))
+        self.assertEqual(len(self.sampled(output_dir)), 30)
@@ -0,0 +1,39 @@
+import json
+import threading
+import unittest
+from http.client import HTTPConnection
+
+from cdeid.deidentifier.deid_server import DeidServer
+from tests.test_line_cache import fake_ensemble_model
+
+
+class DeidServerTest(unittest.TestCase):
+    def setUp(self):
+        model = fake_ensemble_model()
+        self.server = DeidServer(model, port=0, max_wait=0)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def post(self, body):
+        connection = HTTPConnection(*self.server.server_address[:2], timeout=10)
+        self.addCleanup(connection.close)
+        connection.request('POST', '/deid', body=body if isinstance(body, bytes) else json.dumps(body))
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+
+    def test_deid_texts(self):
+        status, content = self.post({'texts': ['seen by John', 'seen today']})
+        self.assertEqual(status, 200)
+        self.assertEqual([result['annotated_text'] for result in content['results']],
+                         ['seen by <**NAME**>', 'seen today'])
+        status, content = self.post({'text': 'seen by John'})
+        self.assertEqual(content['results'][0]['annotated_text'], 'seen by <**NAME**>')
+
+    def test_invalid_requests(self):
+        for body in [{'texts': 'abc'}, {'texts': [1]}, {'text': 1}, {}, ['abc'], 'abc', b'{']:
+            with self.subTest(body=body):
+                status, content = self.post(body)
+                self.assertEqual(status, 400)
+                self.assertIn('Invalid request', content['error'])
@@ -0,0 +1,92 @@
+import unittest
+
+from cdeid.data.document import Document, Sentence, Token
+
+
+def sentence_of(text, tags):
+    sentence = Sentence()
+    sentence.text = text
+    for word, tag in zip(text.split(' '), tags):
+        sentence.add_token(Token(word, tag))
+    return sentence
+
+
+class SentenceEntitiesTest(unittest.TestCase):
+    def test_entities_cached_and_read_only(self):
+        sentence = sentence_of('seen by John Smith', ['O', 'O', 'B-NAME', 'I-NAME'])
+        entities = sentence.entities
+        self.assertEqual(entities, ((8, 18, 'NAME'),))
+        self.assertEqual(sentence.ents, (('John Smith', 'NAME'),))
+        self.assertIs(sentence.entities, entities)
+        with self.assertRaises(TypeError):
+            entities[0] = (0, 4, 'NAME')
+        with self.assertRaises(AttributeError):
+            entities.append((0, 4, 'NAME'))
+
+    def test_add_token_recomputes(self):
+        sentence = sentence_of('seen by John', ['O', 'O', 'B-NAME'])
+        self.assertEqual(sentence.entities, ((8, 12, 'NAME'),))
+        sentence.text = 'seen by John on Monday'
+        sentence.add_token(Token('on', 'O'))
+        sentence.add_token(Token('Monday', 'B-DATE'))
+        self.assertEqual(sentence.entities, ((8, 12, 'NAME'), (16, 22, 'DATE')))
+        self.assertEqual(sentence.ents, (('John', 'NAME'), ('Monday', 'DATE')))
+
+    def test_tokens_setter_recomputes(self):
+        sentence = sentence_of('seen by John', ['O', 'O', 'B-NAME'])
+        self.assertEqual(sentence.ents, (('John', 'NAME'),))
+        sentence.tokens = [Token('seen', 'B-EVENT'), Token('by', 'O'), Token('John', 'O')]
+        self.assertEqual(sentence.entities, ((0, 4, 'EVENT'),))
+        self.assertEqual(sentence.ents, (('seen', 'EVENT'),))
+
+    def test_text_setter_recomputes(self):
+        sentence = sentence_of('seen by John', ['O', 'O', 'B-NAME'])
+        self.assertEqual(sentence.entities, ((8, 12, 'NAME'),))
+        sentence.text = 'seen by   John'
+        self.assertEqual(sentence.entities, ((10, 14, 'NAME'),))
+        self.assertEqual(sentence.ents, (('John', 'NAME'),))
+
+    def test_document_entities_recomputed(self):
+        doc = Document()
+        doc.add_sentence(sentence_of('seen by John', ['O', 'O', 'B-NAME']))
+        self.assertEqual(doc.entities, (((8, 12, 'NAME'),),))
+        doc.add_sentence(sentence_of('Mary', ['B-NAME']))
+        self.assertEqual(doc.ents, ((('John', 'NAME'),), (('Mary', 'NAME'),)))
+        doc.sentences = []
+        self.assertEqual((doc.entities, doc.ents), ((), ()))
+
+
+class TokenOffsetsTest(unittest.TestCase):
+    def test_offsets_give_exact_spans(self):
+        sentence = Sentence()
+        sentence.text = 'John saw John Smith'
+        for text, tag, start in [('John', 'O', 0), ('saw', 'O', 5), ('John', 'B-NAME', 9), ('Smith', 'I-NAME', 14)]:
+            sentence.add_token(Token(text, tag, start, start + len(text)))
+        self.assertEqual(sentence.entities, ((9, 19, 'NAME'),))
+        self.assertEqual(sentence.ents, (('John Smith', 'NAME'),))
+
+    def test_offsets_with_whitespace_tokens(self):
+        sentence = Sentence()
+        sentence.text = 'seen by  John\tSmith '
+        for text, tag, start in [('seen', 'O', 0), ('by', 'O', 5), (' ', 'B-NAME', 8), ('John', 'I-NAME', 9),
+                                 ('\t', 'I-NAME', 13), ('Smith', 'I-NAME', 14), (' ', 'I-NAME', 19)]:
+            sentence.add_token(Token(text, tag, start, start + len(text)))
+        self.assertEqual(sentence.entities, ((9, 19, 'NAME'),))
+        self.assertEqual(sentence.ents, (('John\tSmith', 'NAME'),))
+
+    def test_search_without_offsets(self):
+        sentence = Sentence()
+        sentence.text = 'John saw Mary and  Mary Smith on Monday'
+        for text, tag in [('John', 'B-NAME'), ('saw', 'O'), ('Mary', 'B-NAME'), ('and', 'O'), ('', 'O'),
+                          ('Mary', 'B-NAME'), ('Smith', 'I-NAME'), ('on', 'O'), ('Monday', 'B-DATE')]:
+            sentence.add_token(Token(text, tag))
+        # each entity is searched after the previous one
+        self.assertEqual(sentence.entities, ((0, 4, 'NAME'), (9, 13, 'NAME'), (19, 29, 'NAME'), (33, 39, 'DATE')))
+
+    def test_offsets_and_search_mixed(self):
+        sentence = Sentence()
+        sentence.text = 'Mary saw Mary'
+        sentence.add_token(Token('Mary', 'B-NAME', 0, 4))
+        sentence.add_token(Token('saw', 'O', 5, 8))
+        sentence.add_token(Token('Mary', 'B-NAME'))
+        self.assertEqual(sentence.entities, ((0, 4, 'NAME'), (9, 13, 'NAME')))
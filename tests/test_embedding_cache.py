@@ -0,0 +1,143 @@
+import importlib.util
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from cdeid.models.embedding_cache import EmbeddingCache, sentence_key
+from cdeid.models.flair_trainer import FlairTrainer
+
+
+class FakeToken:
+    def __init__(self, text):
+        self.text = text
+        self.embeddings = {}
+
+    def set_embedding(self, name, vector):
+        self.embeddings[name] = vector
+
+    def get_embedding(self):
+        import torch
+        return torch.cat([self.embeddings[name] for name in sorted(self.embeddings)])
+
+
+class FakeSentence(list):
+    def __init__(self, text):
+        super().__init__(FakeToken(word) for word in text.split())
+
+    def clear_embeddings(self):
+        for token in self:
+            token.embeddings = {}
+
+
+# static embedding with a vector of each word computed from its characters. The embedded sentences are counted
+class FakeEmbedding:
+    name = 'transformer-word-fake'
+    embedding_length = 4
+    static_embeddings = True
+
+    def __init__(self):
+        self.n_embedded = 0
+
+    def vector(self, word):
+        return [len(word), ord(word[0]) / 7, ord(word[-1]) / 3, 1 / 3]
+
+    def embed(self, sentences):
+        import torch
+        for sentence in sentences:
+            self.n_embedded += 1
+            for token in sentence:
+                token.set_embedding(self.name, torch.tensor(self.vector(token.text), dtype=torch.float32))
+
+
+@unittest.skipUnless(importlib.util.find_spec('torch'), 'torch is not installed')
+class EmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.cache_dir))
+        self.texts = ['seen by John Smith', 'call 0412 345 678', 'seen by John Smith', 'discharged today']
+
+    def sentences(self):
+        return [FakeSentence(text) for text in self.texts]
+
+    def test_shard_written_and_reloaded(self):
+        for fp16 in [False, True]:
+            with self.subTest(fp16=fp16):
+                cache_dir = self.cache_dir / str(fp16)
+                embedding = FakeEmbedding()
+                EmbeddingCache(cache_dir, fp16).update(embedding, self.sentences(), batch_size=2)
+                # the repeated sentence is computed once
+                self.assertEqual(embedding.n_embedded, 3)
+                self.assertEqual(len(list(cache_dir.glob('*.npy'))), 1)
+                self.assertEqual(len(list(cache_dir.glob('*.json'))), 1)
+                self.assertEqual(list(cache_dir.glob('*.tmp')), [])
+                self.assertEqual(np.load(str(next(cache_dir.glob('*.npy')))).dtype,
+                                 np.float16 if fp16 else np.float32)
+
+                embedding = FakeEmbedding()
+                cache = EmbeddingCache(cache_dir, fp16)
+                sentences = self.sentences()
+                cache.update(embedding, sentences)
+                self.assertEqual(embedding.n_embedded, 0)
+                self.assertEqual(len(list(cache_dir.glob('*.npy'))), 1)
+
+                self.assertEqual(cache.attach(embedding.name, sentences), 4)
+                for sentence in sentences:
+                    for token in sentence:
+                        np.testing.assert_allclose(token.embeddings[embedding.name].numpy(),
+                                                   embedding.vector(token.text), rtol=1e-3 if fp16 else 1e-6)
+
+    def test_new_sentences_added_in_new_shard(self):
+        embedding = FakeEmbedding()
+        EmbeddingCache(self.cache_dir).update(embedding, self.sentences()[:2])
+        self.texts.append('seen today')
+        cache = EmbeddingCache(self.cache_dir)
+        cache.update(embedding, self.sentences())
+        self.assertEqual(embedding.n_embedded, 2 + 2)
+        self.assertEqual(len(list(self.cache_dir.glob('*.json'))), 2)
+        self.assertEqual(cache.attach(embedding.name, self.sentences()), 5)
+
+    def test_incomplete_shard_ignored(self):
+        vectors = np.ones((4, FakeEmbedding.embedding_length), dtype=np.float32)
+        np.save(str(self.cache_dir / 'incomplete.npy'), vectors)
+        cache = EmbeddingCache(self.cache_dir)
+        self.assertEqual(cache.index, {})
+
+        embedding = FakeEmbedding()
+        sentences = self.sentences()
+        cache.update(embedding, sentences)
+        self.assertEqual(embedding.n_embedded, 3)
+        self.assertEqual(cache.attach(embedding.name, sentences), 4)
+        self.assertNotIn(sentence_key(FakeSentence('unknown words')), cache.index)
+        self.assertEqual(cache.attach(embedding.name, [FakeSentence('unknown words')]), 0)
+
+
+@unittest.skipUnless(importlib.util.find_spec('torch'), 'torch is not installed')
+class AttachCachedEmbeddingsTest(unittest.TestCase):
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workspace)
+        self.corpus = SimpleNamespace(train=[FakeSentence('seen by John')], dev=[FakeSentence('call 0412')],
+                                      test=[FakeSentence('seen by John')])
+        self.static = FakeEmbedding()
+        self.fine_tuned = FakeEmbedding()
+        self.fine_tuned.name = 'transformer-word-fine-tuned'
+        self.fine_tuned.static_embeddings = False
+        self.embeddings = SimpleNamespace(embeddings=[self.static, self.fine_tuned])
+
+    def test_static_embeddings_cached(self):
+        trainer = FlairTrainer(self.workspace, 'train.bio', 'dev.bio', 'test.bio')
+        trainer.attach_cached_embeddings(self.embeddings, self.corpus, batch_size=2)
+        self.assertEqual((self.static.n_embedded, self.fine_tuned.n_embedded), (2, 0))
+        self.assertTrue((Path(self.workspace) / 'embeddings' / 'transformer-word-fake').is_dir())
+        for sentence in self.corpus.train + self.corpus.dev + self.corpus.test:
+            self.assertTrue(all(list(token.embeddings) == [self.static.name] for token in sentence))
+
+    def test_not_cached_without_storage(self):
+        trainer = FlairTrainer(self.workspace, 'train.bio', 'dev.bio', 'test.bio', embeddings_storage_mode='none')
+        trainer.attach_cached_embeddings(self.embeddings, self.corpus, batch_size=2)
+        self.assertEqual(self.static.n_embedded, 0)
+        self.assertFalse((Path(self.workspace) / 'embeddings').exists())
@@ -0,0 +1,497 @@
+import importlib.util
+import random
+import re
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+
+from cdeid.models import ensemble_model
+from cdeid.models.majority_voter import MajorityVoter
+from tests.test_line_cache import fake_ensemble_model
+
+
+class FakeToken:
+    def __init__(self, text, whitespace):
+        self.text = text
+        self.whitespace_ = whitespace
+        self.is_space = text.isspace()
+        self.ent_iob_ = ''
+        self.ent_type_ = ''
+
+
+class FakeDoc(list):
+    def __init__(self, vocab, words, spaces):
+        super().__init__(FakeToken(word, ' ' if space else '') for word, space in zip(words, spaces))
+        self.vocab = vocab
+
+
+# NER which keeps the entities already set on the Doc, like the NER of spacy v2
+class FakeNER:
+    def __init__(self, entity_words, entity_type):
+        self.entity_words = entity_words
+        self.entity_type = entity_type
+
+    def __call__(self, doc):
+        for token in doc:
+            if token.ent_iob_ != '':
+                continue
+            if token.text in self.entity_words:
+                token.ent_iob_ = 'B'
+                token.ent_type_ = self.entity_type
+            else:
+                token.ent_iob_ = 'O'
+        return doc
+
+
+def fake_spacy_model(vocab, entity_words, entity_type):
+    return SimpleNamespace(vocab=vocab, pipeline=[('ner', FakeNER(entity_words, entity_type))])
+
+
+class SpacyLikeToken(str):
+    def __new__(cls, text, idx):
+        token = super().__new__(cls, text)
+        token.text = text
+        token.idx = idx
+        token.whitespace_ = ''
+        token.is_space = text.isspace()
+        return token
+
+
+class SpacyLikeDoc(list):
+    def __init__(self, text, tokens):
+        super().__init__(tokens)
+        self.text = text
+
+
+# tokenize on the whitespaces like spacy: one space after a word is the whitespace of the word, the other
+# whitespaces are whitespace tokens
+def spacy_like_tokenize(text):
+    tokens = []
+    for match in re.finditer(r'\S+|\s+', text):
+        part, idx = match.group(), match.start()
+        if part.isspace() and len(tokens) > 0 and not tokens[-1].is_space and part[0] == ' ':
+            tokens[-1].whitespace_ = ' '
+            part, idx = part[1:], idx + 1
+        if part != '':
+            tokens.append(SpacyLikeToken(part, idx))
+    return SpacyLikeDoc(text, tokens)
+
+
+def entity_tag(word, scheme):
+    return scheme + '-NAME' if word[0].isupper() else 'O'
+
+
+# the stanza document of the sentences of token dicts. The ner processor tags the capitalized words
+class FakeStanzaDocument:
+    def __init__(self, sentences, text):
+        self.text = text
+        self.sentences = [SimpleNamespace(tokens=[SimpleNamespace(text=token['text'], misc=token['misc'])
+                                                  for token in sentence]) for sentence in sentences]
+
+
+def stanza_process(doc):
+    for sentence in doc.sentences:
+        for token in sentence.tokens:
+            # the character offsets of the tokens are the ones in the lines joined by newlines
+            offsets = dict(item.split('=') for item in token.misc.split('|'))
+            if doc.text[int(offsets['start_char']):int(offsets['end_char'])] != token.text:
+                raise Exception('Wrong offsets of {}: {}'.format(token.text, token.misc))
+            token.ner = entity_tag(token.text, 'S')
+    return doc
+
+
+class FakeFlairToken:
+    def __init__(self, text):
+        self.text = text
+        self.tag = None
+
+    def get_tag(self, tag_type):
+        return SimpleNamespace(value=self.tag)
+
+
+def flair_sentence(words):
+    return [FakeFlairToken(word) for word in words]
+
+
+def flair_predict(sentences, mini_batch_size=32, embedding_storage_mode='none'):
+    for sentence in sentences:
+        for token in sentence:
+            token.tag = entity_tag(token.text, 'B')
+
+
+class RestoreSpaceTagsTest(unittest.TestCase):
+    def setUp(self):
+        stanza_doc = SimpleNamespace(TEXT='text', MISC='misc', START_CHAR='start_char', END_CHAR='end_char',
+                                     Document=FakeStanzaDocument)
+        patchers = [mock.patch.object(ensemble_model, 'stanza_doc', stanza_doc),
+                    mock.patch.object(ensemble_model, 'flair_data', SimpleNamespace(Sentence=flair_sentence)),
+                    mock.patch.object(ensemble_model, 'spacy_tokens', SimpleNamespace(Doc=FakeDoc))]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.lines = ['Seen by  John', '\tJohn\tSmith', '  seen by Mary  ', 'Smith \t\n today', '   ', 'John']
+
+    def test_tokenizer_whitespace_tokens(self):
+        doc_tokens = spacy_like_tokenize(' a  b\tc ')
+        self.assertEqual([token.text for token in doc_tokens], [' ', 'a', ' ', 'b', '\t', 'c'])
+        self.assertEqual(''.join(token.text + token.whitespace_ for token in doc_tokens), ' a  b\tc ')
+
+    def test_restore_space_tags(self):
+        doc_tokens = spacy_like_tokenize(' John  seen\t')
+        self.assertEqual(ensemble_model.restore_space_tags(doc_tokens, ['B-NAME', 'O']),
+                         ['O', 'B-NAME', 'O', 'O', 'O'])
+
+    def test_members_aligned_with_shared_tokens(self):
+        docs_tokens = [spacy_like_tokenize(line) for line in self.lines]
+        stanza_model = SimpleNamespace(processors={'ner': SimpleNamespace(process=stanza_process)})
+        flair_model = SimpleNamespace(predict=flair_predict)
+        spacy_model = fake_spacy_model(object(), {'Seen', 'John', 'Smith', 'Mary'}, 'NAME')
+        members = {'stanza': ensemble_model.stanza_tags(stanza_model, docs_tokens),
+                   'flair': ensemble_model.flair_tags(flair_model, docs_tokens),
+                   'spacy': ensemble_model.spacy_tags(spacy_model, docs_tokens)}
+        members['flair_pair'], members['flair_pair_other'] = ensemble_model.flair_pair_tags(
+            flair_model, flair_model, docs_tokens)
+
+        for name, tags in members.items():
+            with self.subTest(member=name):
+                self.assertEqual([len(line_tags) for line_tags in tags],
+                                 [len(doc_tokens) for doc_tokens in docs_tokens])
+                for doc_tokens, line_tags in zip(docs_tokens, tags):
+                    for token, tag in zip(doc_tokens, line_tags):
+                        if token.is_space:
+                            self.assertEqual(tag, 'O')
+                        else:
+                            self.assertEqual(tag[2:], 'NAME' if token.text[0].isupper() else '')
+        # the tag sequences have the same length and are voted together
+        self.assertEqual(MajorityVoter().vote([sum(tags, []) for tags in members.values()]),
+                         [tag for line_tags in members['flair'] for tag in line_tags])
+
+
+@unittest.skipUnless(importlib.util.find_spec('spacy'), 'spacy is not installed')
+class SpacyWhitespaceTokensTest(unittest.TestCase):
+    def test_same_tokens_as_spacy(self):
+        import spacy
+
+        lines = ['Seen by  John', '\tJohn\tSmith', '  seen by Mary  ', 'Smith \t\n today', '   ', 'John']
+        for doc_tokens, line in zip(ensemble_model.tokenize_lines(spacy.blank('en'), lines), lines):
+            self.assertEqual([(token.text, token.whitespace_, token.is_space) for token in doc_tokens],
+                             [(token.text, token.whitespace_, token.is_space) for token in spacy_like_tokenize(line)])
+
+
+class LengthBatchesTest(unittest.TestCase):
+    def test_padded_size_within_budget(self):
+        rng = random.Random(2020)
+        docs_tokens = [[None] * rng.choice([1, 2, 5, 30, 200]) for _ in range(300)]
+        batches = ensemble_model.length_batches(docs_tokens, max_tokens=256, batch_size=16)
+        self.assertEqual(sorted(k for batch in batches for k in batch), list(range(300)))
+        for batch in batches:
+            lengths = [len(docs_tokens[k]) for k in batch]
+            self.assertLessEqual(len(batch), 16)
+            self.assertEqual(lengths, sorted(lengths, reverse=True))
+            self.assertLessEqual(lengths[0] * len(batch), 256)
+
+    def test_line_longer_than_budget_alone(self):
+        docs_tokens = [[None] * 3, [None] * 500, [None] * 3]
+        self.assertEqual(ensemble_model.length_batches(docs_tokens, max_tokens=100), [[1], [0, 2]])
+
+    def test_ties_keep_line_order(self):
+        docs_tokens = [[None] * 4 for _ in range(5)]
+        self.assertEqual(ensemble_model.length_batches(docs_tokens, max_tokens=8), [[0, 1], [2, 3], [4]])
+        self.assertEqual(ensemble_model.length_batches(docs_tokens, batch_size=3), [[0, 1, 2], [3, 4]])
+
+    def test_empty(self):
+        self.assertEqual(ensemble_model.length_batches([]), [])
+
+
+class PredictLinesTest(unittest.TestCase):
+    def predict(self, model, lines, **kwargs):
+        return [(sentence.text, [(token.text, token.ner_tag, token.start_char, token.end_char)
+                                 for token in sentence.tokens], tags)
+                for sentence, tags in model.predict_lines(lines, **kwargs)]
+
+    def test_same_as_line_by_line(self):
+        rng = random.Random(2020)
+        words = ['seen', 'by', 'John', 'Smith', 'on', 'Monday', 'call', '0412']
+        lines = []
+        for _ in range(200):
+            n_words = rng.choice([0, 1, 3, 8, 40, 150])
+            lines.append(' '.join(rng.choice(words) for _ in range(n_words)) if n_words > 0 else rng.choice(['', ' ']))
+
+        model = fake_ensemble_model()
+        batch_sizes = []
+        predict_batch = model.predict_batch
+        model.predict_batch = lambda docs_tokens: batch_sizes.append(
+            max(len(doc_tokens) for doc_tokens in docs_tokens) * len(docs_tokens)) or predict_batch(docs_tokens)
+
+        results = self.predict(model, lines, batch_size=16, max_tokens=512)
+        expected = [result for line in lines for result in self.predict(fake_ensemble_model(), [line])]
+        self.assertEqual(results, expected)
+        self.assertTrue(all(size <= 512 for size in batch_sizes))
+        # the empty and whitespace lines have no tokens and are not predicted
+        self.assertEqual(len(model.predicted_lines), len({line for line in lines if line.strip() != ''}))
+        for line, (text, tokens, tags) in zip(lines, results):
+            self.assertEqual(text, line)
+            if line.strip() == '':
+                self.assertEqual((tokens, tags), ([], []))
+
+
+class LoadSpacyTest(unittest.TestCase):
+    def setUp(self):
+        self.spacy = SimpleNamespace(util=SimpleNamespace(get_model_meta=lambda path: {
+            'pipeline': ['tagger', 'parser', 'ner']}), load=mock.Mock())
+        patcher = mock.patch.object(ensemble_model, 'spacy', self.spacy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ner_only(self):
+        ensemble_model.load_spacy('model-best')
+        self.spacy.load.assert_called_once_with('model-best', disable=['tagger', 'parser'])
+
+    def test_full_pipeline(self):
+        ensemble_model.load_spacy('model-best', ner_only=False)
+        self.spacy.load.assert_called_once_with('model-best', disable=[])
+
+    def test_shared_vocab_not_loaded(self):
+        vocab = object()
+        ensemble_model.load_spacy('model-best', vocab=vocab)
+        self.spacy.load.assert_called_once_with('model-best', vocab=vocab, disable=['tagger', 'parser', 'vocab'])
+
+
+class SpacyTagsTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ensemble_model, 'spacy_tokens', SimpleNamespace(Doc=FakeDoc))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def predict_pair(self, share_vectors):
+        vocab = object()
+        spacy_model = fake_spacy_model(vocab, {'John', 'Sydney'}, 'PERSON')
+        spacy_model_imbalanced = fake_spacy_model(vocab if share_vectors else object(), {'Sydney'}, 'ADDRESS')
+        lines = [['John', 'moved', 'to', 'Sydney'], ['Seen', 'by', 'John']]
+        docs_tokens = [FakeDoc(vocab, words, [True] * (len(words) - 1) + [False]) for words in lines]
+        tags = ensemble_model.spacy_tags(spacy_model, docs_tokens)
+        tags_imbalanced = ensemble_model.spacy_tags(spacy_model_imbalanced, docs_tokens)
+        return docs_tokens, tags, tags_imbalanced
+
+    def test_imbalanced_tags_independent_of_shared_vocab(self):
+        _, tags, tags_imbalanced = self.predict_pair(share_vectors=False)
+        _, tags_shared, tags_imbalanced_shared = self.predict_pair(share_vectors=True)
+        self.assertEqual(tags, tags_shared)
+        self.assertEqual(tags_imbalanced, tags_imbalanced_shared)
+        self.assertEqual(tags_imbalanced_shared, [['O', 'O', 'O', 'B-ADDRESS'], ['O', 'O', 'O']])
+
+    def test_tokenizer_docs_not_annotated(self):
+        docs_tokens, _, _ = self.predict_pair(share_vectors=True)
+        self.assertTrue(all(token.ent_iob_ == '' for doc_tokens in docs_tokens for token in doc_tokens))
+
+
+@unittest.skipUnless(importlib.util.find_spec('spacy'), 'spacy is not installed')
+class MmapSpacyVectorsTest(unittest.TestCase):
+    def test_vectors_linked_as_memory_map(self):
+        import spacy
+        from thinc.extra import load_nlp
+
+        nlp = spacy.blank('en')
+        nlp.vocab.vectors.name = 'test_mmap_vectors'
+        for i, word in enumerate(['patient', 'doctor', 'hospital']):
+            nlp.vocab.set_vector(word, np.full(4, i, dtype=np.float32))
+        with tempfile.TemporaryDirectory() as model_dir:
+            nlp.to_disk(model_dir)
+            nlp = spacy.load(model_dir)
+            vectors = np.array(nlp.vocab.vectors.data)
+            self.assertTrue(ensemble_model.mmap_spacy_vectors(nlp, model_dir))
+            self.assertIsInstance(nlp.vocab.vectors.data, np.memmap)
+            linked = [data for (_, name), data in load_nlp.VECTORS.items() if name == 'test_mmap_vectors']
+            self.assertTrue(linked and isinstance(linked[0], np.memmap))
+            np.testing.assert_array_equal(nlp.vocab.vectors.data, vectors)
+            del nlp, linked
+            load_nlp.VECTORS.clear()
+
+
+@unittest.skipUnless(importlib.util.find_spec('spacy'), 'spacy is not installed')
+class SpacyNerOnlyTest(unittest.TestCase):
+    def test_same_predictions_without_tagger(self):
+        import spacy
+
+        nlp = spacy.blank('en')
+        nlp.add_pipe(nlp.create_pipe('tagger'))
+        ner = nlp.create_pipe('ner')
+        ner.add_label('NAME')
+        nlp.add_pipe(ner)
+        nlp.begin_training()
+        lines = ['Seen by John Smith on Monday', 'Patient seen and examined', '']
+        with tempfile.TemporaryDirectory() as model_dir:
+            nlp.to_disk(model_dir)
+            spacy_model = ensemble_model.load_spacy(model_dir, ner_only=False)
+            spacy_model_ner = ensemble_model.load_spacy(model_dir)
+            self.assertEqual(spacy_model_ner.pipe_names, ['ner'])
+            docs_tokens = ensemble_model.tokenize_lines(spacy_model_ner, lines)
+            self.assertEqual(ensemble_model.spacy_tags(spacy_model_ner, docs_tokens),
+                             ensemble_model.spacy_tags(spacy_model, docs_tokens))
+
+
+# EnsembleModel whose models return the given tags of each line and record the lines they predict
+def stub_member_model(member_tags, vote_weights=None, cascade=ensemble_model.CASCADE_ORDER):
+    model = object.__new__(ensemble_model.EnsembleModel)
+    model.executor = None
+    vote_weights = vote_weights or {}
+    model.vote_weights = {name: vote_weights.get(name, 1) for name in ensemble_model.VOTE_ORDER}
+    model.voter = MajorityVoter([model.vote_weights[name] for name in ensemble_model.VOTE_ORDER])
+    model.cascade = cascade
+    model.cascade_stats = {'lines': 0,
+                           'skipped_lines': {name: 0 for name in ensemble_model.VOTE_ORDER},
+                           'predicted_lines': {name: 0 for name in ensemble_model.VOTE_ORDER},
+                           'seconds': {name: 0.0 for name in ensemble_model.VOTE_ORDER}}
+    model.predicted = {name: [] for name in ensemble_model.VOTE_ORDER}
+
+    def job(name, docs_tokens):
+        def run():
+            model.predicted[name] += [doc_tokens.line_id for doc_tokens in docs_tokens]
+            return [member_tags[name][doc_tokens.line_id] for doc_tokens in docs_tokens]
+        return run
+    model.member_jobs = lambda docs_tokens, batch_size=32: {name: job(name, docs_tokens)
+                                                            for name in ensemble_model.VOTE_ORDER}
+    return model
+
+
+class LineTokens(list):
+    def __init__(self, line_id, n_tokens):
+        super().__init__([None] * n_tokens)
+        self.line_id = line_id
+
+
+class CascadeTest(unittest.TestCase):
+    # the models mostly agree with the true tags of the lines
+    def random_member_tags(self, rng, n_lines):
+        true_tags = [[rng.choice(['O', 'O', 'B-NAME', 'I-NAME', 'S-DATE']) for _ in range(rng.randint(1, 6))]
+                     for _ in range(n_lines)]
+        noise = rng.choice([0.05, 0.3])
+        return {name: [[rng.choice(['O', 'B-NAME', 'B-DATE']) if rng.random() < noise else tag for tag in tags]
+                       for tags in true_tags]
+                for name in ensemble_model.VOTE_ORDER}
+
+    def test_same_tags_as_full_vote(self):
+        rng = random.Random(2020)
+        for vote_weights in [None, {'flair_imbalanced': 2}, {'spacy': 0.5, 'stanza': 1.5, 'flair': 3}]:
+            for _ in range(20):
+                member_tags = self.random_member_tags(rng, 30)
+                docs_tokens = [LineTokens(k, len(tags)) for k, tags in enumerate(member_tags['spacy'])]
+                full = stub_member_model(member_tags, vote_weights, cascade=None)
+                cascade = stub_member_model(member_tags, vote_weights)
+
+                full_tags = full.voter.vote([sum(tags, []) for tags in full.predict_batch(docs_tokens)])
+                cascade_tags = cascade.voter.vote([sum(tags, []) for tags in cascade.predict_batch(docs_tokens)])
+                self.assertEqual(cascade_tags, full_tags)
+                self.assertTrue(all(len(full.predicted[name]) == 30 for name in ensemble_model.VOTE_ORDER))
+
+    def test_decided_lines_not_predicted_by_later_stages(self):
+        rng = random.Random(2021)
+        n_skipped = 0
+        for vote_weights in [None, {'flair_imbalanced': 2, 'spacy': 0.5}]:
+            for _ in range(20):
+                member_tags = self.random_member_tags(rng, 30)
+                model = stub_member_model(member_tags, vote_weights)
+                model.predict_batch([LineTokens(k, len(tags)) for k, tags in enumerate(member_tags['spacy'])])
+
+                # a line is predicted by a stage unless it is decided by the models of the previous stages
+                voted = []
+                for stage_id, stage in enumerate(model.cascade):
+                    for k in range(30):
+                        predicted = [k in model.predicted[name] for name in stage]
+                        self.assertEqual(len(set(predicted)), 1)
+                        if stage_id == 0:
+                            self.assertTrue(predicted[0])
+                            continue
+                        remaining = [name for later in model.cascade[stage_id:] for name in later]
+                        decided, _ = MajorityVoter().decided([member_tags[name][k] for name in voted],
+                                                             [model.vote_weights[name] for name in voted],
+                                                             sum(model.vote_weights[name] for name in remaining))
+                        self.assertEqual(predicted[0], not decided.all())
+                        n_skipped += not predicted[0]
+                    voted += stage
+                for name in ensemble_model.VOTE_ORDER:
+                    self.assertEqual(model.cascade_stats['skipped_lines'][name] + len(model.predicted[name]), 30)
+        self.assertGreater(n_skipped, 0)
+
+
+class FakeFlairEmbedding:
+    def __init__(self, name, weight, static_embeddings=True):
+        self.name = name
+        self.weight = weight
+        self.static_embeddings = static_embeddings
+
+
+class FakeFlairEmbeddings:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def state_dict(self):
+        return {'{}.weight'.format(i): embedding.weight for i, embedding in enumerate(self.embeddings)}
+
+
+# Flair tagger tagging its entity words. The embeddings are computed unless they are kept on the tokens
+class FakeFlairTagger:
+    def __init__(self, entity_words, embeddings=None):
+        self.entity_words = entity_words
+        self.embeddings = embeddings
+        self.calls = []
+
+    def predict(self, sentences, mini_batch_size=32, embedding_storage_mode='none'):
+        n_embedded = 0
+        for sentence in sentences:
+            for token in sentence:
+                if not getattr(token, 'embedded', False):
+                    n_embedded += 1
+                token.embedded = embedding_storage_mode != 'none'
+                token.tag = 'B-NAME' if token.text in self.entity_words else 'O'
+        self.calls.append((embedding_storage_mode, n_embedded))
+
+
+@unittest.skipUnless(importlib.util.find_spec('torch'), 'torch is not installed')
+class FlairSharedEmbeddingsTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ensemble_model, 'flair_data', SimpleNamespace(Sentence=flair_sentence))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.docs_tokens = [spacy_like_tokenize(line) for line in ['Seen by  John Smith', 'Mary', '\tSmith']]
+
+    def embeddings(self, name='transformer-word-bert', weight=(1.0, 2.0), static_embeddings=True):
+        import torch
+        return FakeFlairEmbeddings([FakeFlairEmbedding(name, torch.tensor(weight), static_embeddings)])
+
+    def test_same_flair_embeddings(self):
+        tagger = FakeFlairTagger(set(), self.embeddings())
+        self.assertTrue(ensemble_model.same_flair_embeddings(tagger, FakeFlairTagger(set(), self.embeddings())))
+        for other in [self.embeddings(weight=(1.0, 2.5)), self.embeddings(name='transformer-word-other'),
+                      self.embeddings(static_embeddings=False)]:
+            self.assertFalse(ensemble_model.same_flair_embeddings(tagger, FakeFlairTagger(set(), other)))
+
+    def test_pair_tags_same_as_separate_taggers(self):
+        tagger = FakeFlairTagger({'John', 'Mary'})
+        tagger_other = FakeFlairTagger({'Smith'})
+        tags, tags_other = ensemble_model.flair_pair_tags(tagger, tagger_other, self.docs_tokens)
+        n_tokens = sum(len([token for token in doc_tokens if not token.is_space]) for doc_tokens in self.docs_tokens)
+        # the embeddings are kept on the tokens by the first tagger, reused and dropped by the second one
+        self.assertEqual(tagger.calls, [('cpu', n_tokens)])
+        self.assertEqual(tagger_other.calls, [('none', 0)])
+
+        self.assertEqual(tags, ensemble_model.flair_tags(FakeFlairTagger({'John', 'Mary'}), self.docs_tokens))
+        self.assertEqual(tags_other, ensemble_model.flair_tags(FakeFlairTagger({'Smith'}), self.docs_tokens))
+        self.assertEqual(tags_other, [['O', 'O', 'O', 'O', 'B-NAME'], ['O'], ['O', 'B-NAME']])
+
+    def test_member_jobs_fall_back_to_separate_taggers(self):
+        results = {}
+        for shared in [True, False]:
+            model = object.__new__(ensemble_model.EnsembleModel)
+            model.flair_model = FakeFlairTagger({'Smith'}, self.embeddings())
+            model.flair_model_imbalanced = FakeFlairTagger({'John', 'Mary'}, self.embeddings(weight=(0.0, 0.0)))
+            model.flair_shared_embeddings = shared
+            jobs = model.member_jobs(self.docs_tokens)
+            results[shared] = (jobs['flair'](), jobs['flair_imbalanced']())
+            storage_modes = [mode for tagger in [model.flair_model_imbalanced, model.flair_model]
+                             for mode, _ in tagger.calls]
+            self.assertEqual(storage_modes, ['cpu', 'none'] if shared else ['none', 'none'])
+        self.assertEqual(results[True], results[False])
@@ -0,0 +1,50 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+
+from cdeid.data.document import Document, Sentence, Token
+from cdeid.display.html_generator import generate_html, get_template, mako_module_directory
+
+
+class HtmlGeneratorTest(unittest.TestCase):
+    def test_template_not_compiled_to_shared_directory(self):
+        self.assertIsNone(get_template().module_directory)
+        self.assertIs(get_template(), get_template())
+
+    def test_module_directory_private_in_workspace(self):
+        workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workspace)
+        module_directory = mako_module_directory(workspace)
+        self.assertEqual(module_directory, str(Path(workspace) / '.mako_modules'))
+        self.assertEqual(stat.S_IMODE(os.stat(module_directory).st_mode), 0o700)
+
+        doc = self.doc()
+        generate_html(doc, str(Path(workspace) / 'display.html'), module_directory=module_directory)
+        self.assertEqual(get_template(module_directory=module_directory).module_directory, module_directory)
+        self.assertTrue(any(path.suffix == '.py' for path in Path(module_directory).rglob('*')))
+        # a directory opened to the other users is made private again
+        os.chmod(module_directory, 0o777)
+        mako_module_directory(workspace)
+        self.assertEqual(stat.S_IMODE(os.stat(module_directory).st_mode), 0o700)
+
+    def doc(self):
+        sentence = Sentence()
+        sentence.text = 'seen by John'
+        for text, tag, start in [('seen', 'O', 0), ('by', 'O', 5), ('John', 'B-NAME', 8)]:
+            sentence.add_token(Token(text, tag, start, start + len(text)))
+        doc = Document()
+        doc.add_sentence(sentence)
+        return doc
+
+    def test_generate_html(self):
+        doc = self.doc()
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        html_file = str(Path(output_dir) / 'display.html')
+        generate_html(doc, html_file)
+        html = Path(html_file).read_text()
+        self.assertIn('seen by <span class="entity name"><span class="words">John</span>'
+                      '<span class="ner">NAME</span></span>', html)
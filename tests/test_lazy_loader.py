@@ -0,0 +1,54 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+from cdeid.utils import lazy_loader
+from cdeid.utils.lazy_loader import lazy_import, load_model
+
+# import the package and run the command line help with the toolkits made unimportable
+STARTUP_SCRIPT = '''
+import runpy
+import sys
+
+HEAVY_MODULES = {'spacy', 'stanza', 'flair', 'torch', 'thinc', 'transformers', 'en_core_web_lg'}
+
+
+class BlockHeavyModules:
+    def find_spec(self, name, path=None, target=None):
+        if name.split('.')[0] in HEAVY_MODULES:
+            raise ImportError('{} imported at startup'.format(name))
+
+
+sys.meta_path.insert(0, BlockHeavyModules())
+import cdeid.models.trainer
+import cdeid.deidentifier.phi_deid
+import cdeid.deidentifier.deid_server
+sys.argv = ['cdeid', '--help']
+try:
+    runpy.run_module('cdeid', run_name='__main__', alter_sys=True)
+except SystemExit as e:
+    sys.exit(e.code)
+'''
+
+
+class LazyLoaderTest(unittest.TestCase):
+    def test_import_on_first_access(self):
+        module = lazy_import('cdeid.not_a_module')
+        with self.assertRaises(ImportError):
+            module.anything
+        self.assertEqual(lazy_import('json').dumps([1]), '[1]')
+
+    def test_model_loaded_once(self):
+        self.addCleanup(lazy_loader._models.pop, 'test_model', None)
+        calls = []
+        for _ in range(3):
+            model = load_model('test_model', lambda: calls.append(1) or object())
+        self.assertIs(model, load_model('test_model', object))
+        self.assertEqual(len(calls), 1)
+
+    def test_startup_without_toolkits(self):
+        result = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=str(Path(__file__).resolve().parents[1]),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('--command', result.stdout)
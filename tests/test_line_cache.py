@@ -0,0 +1,90 @@
+import unittest
+from types import SimpleNamespace
+
+from cdeid.models.ensemble_model import VOTE_ORDER, EnsembleModel
+from cdeid.models.line_cache import LineCache
+from cdeid.models.majority_voter import MajorityVoter
+
+
+class FakeToken(str):
+    def __new__(cls, text, idx):
+        token = super().__new__(cls, text)
+        token.text = text
+        token.idx = idx
+        token.is_space = False
+        return token
+
+
+# split the lines on the spaces
+def tokenize(lines, batch_size=32):
+    docs = []
+    for line in lines:
+        tokens = []
+        idx = 0
+        for word in line.split(' '):
+            tokens.append(FakeToken(word, idx))
+            idx += len(word) + 1
+        docs.append(tokens)
+    return docs
+
+
+class LineCacheTest(unittest.TestCase):
+    def test_least_recently_used_removed(self):
+        cache = LineCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.stats(), {'size': 2, 'max_size': 2, 'hits': 3, 'misses': 1, 'hit_rate': 0.75})
+
+    def test_clear(self):
+        cache = LineCache()
+        cache.put('a', 1)
+        cache.get('a')
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 0)
+        self.assertEqual(cache.stats()['hits'], 0)
+
+
+# EnsembleModel whose models all tag the capitalized words as NAME. The predicted lines are recorded
+def fake_ensemble_model(cache_size=0):
+    model = object.__new__(EnsembleModel)
+    model.spacy_model = SimpleNamespace(tokenizer=SimpleNamespace(pipe=tokenize))
+    model.voter = MajorityVoter()
+    model.line_cache = LineCache(cache_size) if cache_size > 0 else None
+    model.predicted_lines = []
+
+    def predict_batch(docs_tokens):
+        model.predicted_lines += [' '.join(doc_tokens) for doc_tokens in docs_tokens]
+        tags = [['B-NAME' if token[0].isupper() else 'O' for token in doc_tokens] for doc_tokens in docs_tokens]
+        return [tags for _ in VOTE_ORDER]
+    model.predict_batch = predict_batch
+    return model
+
+
+class EnsembleLineCacheTest(unittest.TestCase):
+    def predict(self, model, lines):
+        return [(sentence.text, [(token.text, token.ner_tag, token.start_char, token.end_char)
+                                 for token in sentence.tokens], tags)
+                for sentence, tags in model.predict_lines(lines)]
+
+    def test_repeated_lines_predicted_once(self):
+        lines = ['Patient seen and examined', 'seen by John', '', 'Patient seen and examined']
+        model = fake_ensemble_model(cache_size=10)
+        expected = self.predict(fake_ensemble_model(cache_size=0), lines)
+
+        self.assertEqual(self.predict(model, lines), expected)
+        self.assertEqual(self.predict(model, lines), expected)
+        self.assertEqual(model.predicted_lines, ['Patient seen and examined', 'seen by John'])
+        self.assertEqual(model.cache_stats()['hits'], 3)
+        self.assertEqual(model.cache_stats()['size'], 2)
+
+    def test_cache_disabled(self):
+        model = fake_ensemble_model(cache_size=0)
+        self.predict(model, ['seen by John'])
+        self.predict(model, ['seen by John'])
+        self.assertEqual(model.predicted_lines, ['seen by John', 'seen by John'])
+        self.assertIsNone(model.cache_stats())
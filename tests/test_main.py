@@ -0,0 +1,27 @@
+import unittest
+from unittest import mock
+
+from cdeid import __main__ as cdeid_main
+
+
+class VoteWeightsOptionTest(unittest.TestCase):
+    def test_parse(self):
+        options = cdeid_main.get_options(['--command', 'deid', '--workspace', 'ws',
+                                          '--vote_weights', 'flair_imbalanced=2', 'spacy=0.5'])
+        self.assertEqual(dict(options.vote_weights), {'flair_imbalanced': 2.0, 'spacy': 0.5})
+        self.assertEqual(cdeid_main.get_options(['--command', 'deid', '--workspace', 'ws']).vote_weights, [])
+
+    def test_invalid(self):
+        for value in ['bert=2', 'spacy', 'spacy=x', 'spacy=-1']:
+            with self.subTest(value=value), mock.patch('sys.stderr'):
+                with self.assertRaises(SystemExit):
+                    cdeid_main.get_options(['--command', 'deid', '--workspace', 'ws', '--vote_weights', value])
+
+    def test_passed_to_models(self):
+        for command in ['deid', 'serve']:
+            options = cdeid_main.get_options(['--command', command, '--workspace', 'ws', '--deid_file', 'a.txt',
+                                              '--vote_weights', 'stanza=3'])
+            with self.subTest(command=command), mock.patch.object(cdeid_main, 'get_options', return_value=options), \
+                    mock.patch.object(cdeid_main, 'PHIDeid') as phi_deid, mock.patch.object(cdeid_main, 'serve'):
+                cdeid_main.main()
+                self.assertEqual(phi_deid.call_args[1]['vote_weights'], {'stanza': 3.0})
@@ -0,0 +1,86 @@
+import itertools
+import random
+import unittest
+from collections import Counter
+
+from cdeid.models.majority_voter import MajorityVoter
+from cdeid.utils.converter import to_bio2
+
+TAGS = ['O', 'B-NAME', 'I-NAME', 'S-NAME', 'E-NAME', 'U-DATE', 'L-DATE', 'B-DATE']
+
+
+# the vote of the Counter of each token, counting the weight of each model in the order of the models
+def counter_vote(tag_sequences, weights=None):
+    weights = [1] * len(tag_sequences) if weights is None else weights
+    bio2_sequences = [to_bio2(tags) for tags in tag_sequences]
+    final_tags = []
+    for token_tags in zip(*bio2_sequences):
+        votes = Counter()
+        for tag, weight in zip(token_tags, weights):
+            votes[tag] += weight
+        final_tags.append(votes.most_common(1)[0][0])
+    return final_tags
+
+
+def random_sequences(rng, n_models, n_tokens, tags=TAGS):
+    return [[rng.choice(tags) for _ in range(n_tokens)] for _ in range(n_models)]
+
+
+class MajorityVoterTest(unittest.TestCase):
+    def test_vote_same_as_counter(self):
+        rng = random.Random(2020)
+        for n_models in [1, 2, 3, 6]:
+            for _ in range(50):
+                tag_sequences = random_sequences(rng, n_models, 30)
+                self.assertEqual(MajorityVoter().vote(tag_sequences), counter_vote(tag_sequences))
+
+    def test_ties_go_to_first_model(self):
+        tag_sequences = [['B-NAME', 'O', 'S-DATE'],
+                         ['O', 'B-NAME', 'B-NAME'],
+                         ['B-NAME', 'O', 'U-NAME'],
+                         ['O', 'B-NAME', 'B-DATE']]
+        self.assertEqual(MajorityVoter().vote(tag_sequences), ['B-NAME', 'O', 'B-DATE'])
+        self.assertEqual(MajorityVoter().vote(tag_sequences), counter_vote(tag_sequences))
+
+    def test_weighted_vote_same_as_counter(self):
+        rng = random.Random(2021)
+        for _ in range(100):
+            weights = [rng.choice([0.5, 1, 1.5, 2]) for _ in range(6)]
+            tag_sequences = random_sequences(rng, 6, 30)
+            self.assertEqual(MajorityVoter(weights).vote(tag_sequences), counter_vote(tag_sequences, weights))
+
+    def test_vote_checks_lengths(self):
+        with self.assertRaises(Exception):
+            MajorityVoter().vote([['O', 'O'], ['O']])
+        with self.assertRaises(Exception):
+            MajorityVoter([1, 1]).vote([['O'], ['O'], ['O']])
+
+    def test_vote_empty_sequences(self):
+        self.assertEqual(MajorityVoter().vote([[], []]), [])
+
+    # the decided tokens keep their leading tag whatever the remaining models vote
+    def test_decided_sound_for_all_completions(self):
+        rng = random.Random(2022)
+        tags = ['O', 'B-NAME', 'S-DATE']
+        for _ in range(40):
+            n_models = rng.choice([3, 4, 5])
+            n_voted = rng.randrange(1, n_models)
+            weights = [rng.choice([0.5, 1, 2]) for _ in range(n_models)]
+            voted = random_sequences(rng, n_voted, 12, tags)
+            decided, leaders = MajorityVoter().decided(voted, weights[:n_voted], sum(weights[n_voted:]))
+
+            for remaining_tags in itertools.product(tags, repeat=n_models - n_voted):
+                remaining = [[tag] * 12 for tag in remaining_tags]
+                final_tags = MajorityVoter(weights).vote(voted + remaining)
+                for i in range(12):
+                    if decided[i]:
+                        self.assertEqual(final_tags[i], leaders[i])
+
+    def test_decided_when_out_of_reach(self):
+        voted = [['B-NAME', 'O'], ['B-NAME', 'B-NAME'], ['S-NAME', 'O']]
+        decided, leaders = MajorityVoter().decided(voted, [1, 1, 1], 2)
+        self.assertEqual(list(decided), [True, False])
+        self.assertEqual(leaders, ['B-NAME', 'O'])
+        # a tie with the remaining models is not decided
+        decided, _ = MajorityVoter().decided(voted, [1, 1, 1], 3)
+        self.assertEqual(list(decided), [False, False])
@@ -0,0 +1,110 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from cdeid.data.document import Document, Sentence, Token
+from cdeid.deidentifier import phi_deid
+from cdeid.deidentifier.phi_deid import PHIDeid
+
+
+# tag the capitalized words as NAME
+def predict_line(line):
+    sentence = Sentence()
+    sentence.text = line
+    start = 0
+    for word in line.split(' '):
+        if word != '':
+            sentence.add_token(Token(word, 'B-NAME' if word[0].isupper() else 'O', start, start + len(word)))
+        start += len(word) + 1
+    return sentence, [(token.text, token.ner_tag) for token in sentence.tokens]
+
+
+class FakeModel:
+    cascade = None
+
+    def predict(self, text):
+        if 'FAIL' in text:
+            raise Exception('prediction failed')
+        doc = Document()
+        doc.text = text
+        preds = [predict_line(line) for line in text.splitlines()]
+        for sentence, _ in preds:
+            doc.add_sentence(sentence)
+        return doc, [tags for _, tags in preds]
+
+    def predict_stream(self, lines, chunk_lines=1000):
+        for line in lines:
+            if 'FAIL' in line:
+                raise Exception('prediction failed')
+            yield predict_line(line)
+
+    def cache_stats(self):
+        return None
+
+
+class PHIDeidTest(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, str(self.root))
+        self.input_dir = self.root / 'input'
+        self.output_dir = self.root / 'output'
+        self.output_dir.mkdir()
+        self.deider = object.__new__(PHIDeid)
+        self.deider.model = FakeModel()
+        self.deider.deid_output_dir = str(self.output_dir)
+        self.deider.module_directory = None
+
+    def write_input(self, name, text):
+        path = self.input_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+        return str(path)
+
+    def test_same_names_in_subdirectories(self):
+        for stream in [False, True]:
+            with self.subTest(stream=stream):
+                shutil.rmtree(str(self.output_dir))
+                self.output_dir.mkdir()
+                files = [self.write_input('a/note.txt', 'seen by John'),
+                         self.write_input('b/note.txt', 'seen by Mary')]
+                n_files = self.deider.deid_files(files, stream=stream, deid_dir=str(self.input_dir))
+                self.assertEqual(n_files, 2)
+                self.assertEqual((self.output_dir / 'a' / 'note.annotated.txt').read_text(), 'seen by <**NAME**>')
+                self.assertEqual((self.output_dir / 'b' / 'note.annotated.txt').read_text(), 'seen by <**NAME**>')
+                self.assertTrue((self.output_dir / 'b' / 'note.html').exists())
+
+    def test_same_names_without_input_directory(self):
+        files = [self.write_input('a/note.txt', 'seen by John'),
+                 self.write_input('b/note.txt', 'seen by Mary')]
+        with self.assertRaises(Exception):
+            self.deider.deid_files(files)
+        self.assertEqual(list(self.output_dir.iterdir()), [])
+
+    def test_failed_file_does_not_stop_others(self):
+        files = [self.write_input('bad.txt', 'FAIL'),
+                 self.write_input('good.txt', 'seen by John')]
+        n_files = self.deider.deid_files(files, deid_dir=str(self.input_dir))
+        self.assertEqual(n_files, 1)
+        self.assertEqual(sorted(path.name for path in self.output_dir.iterdir()),
+                         ['good.annotated.txt', 'good.html'])
+
+    def test_failed_stream_leaves_no_outputs(self):
+        files = [self.write_input('bad.txt', 'seen by John\nFAIL'),
+                 self.write_input('good.txt', 'seen by John')]
+        n_files = self.deider.deid_files(files, stream=True, deid_dir=str(self.input_dir))
+        self.assertEqual(n_files, 1)
+        self.assertEqual(sorted(path.name for path in self.output_dir.iterdir()),
+                         ['good.annotated.txt', 'good.html'])
+
+    def test_interrupted_output_not_skipped(self):
+        deid_file = self.write_input('note.txt', 'seen by John')
+        with mock.patch.object(phi_deid, 'annotate_doc', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.deider.output(self.deider(deid_file), deid_file)
+        self.assertFalse((self.output_dir / 'note.html').exists())
+        self.assertFalse((self.output_dir / 'note.annotated.txt').exists())
+
+        self.assertEqual(self.deider.deid_files([deid_file]), 1)
+        self.assertEqual((self.output_dir / 'note.annotated.txt').read_text(), 'seen by <**NAME**>')
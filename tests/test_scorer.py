@@ -0,0 +1,94 @@
+import logging
+import random
+import unittest
+from collections import Counter
+
+from cdeid.utils.resources import PACKAGE_NAME
+from cdeid.utils.scorer import decode_from_bio2, score_by_entity
+
+logger = logging.getLogger(PACKAGE_NAME)
+
+
+# the previous score_by_entity, matching the entities as lists of dicts
+def score_by_entity_lists(pred_tag_sequences, gold_tag_sequences):
+    def decode_all(tag_sequences):
+        ents = []
+        for sent_id, tags in enumerate(tag_sequences):
+            for ent in decode_from_bio2(tags):
+                ent['sent_id'] = sent_id
+                ents += [ent]
+        return ents
+
+    gold_ents = decode_all(gold_tag_sequences)
+    pred_ents = decode_all(pred_tag_sequences)
+    fp = [p for p in pred_ents if p not in gold_ents]
+    fn = [g for g in gold_ents if g not in pred_ents]
+    logger.info('Predict entities in total: {}'.format(len(pred_ents)))
+    logger.info('Gold entities in total: {}'.format(len(gold_ents)))
+    logger.info('False Positive: {}'.format(len(fp)))
+    logger.info('False Negative: {}'.format(len(fn)))
+
+    correct_by_type = Counter(p['type'] for p in pred_ents if p in gold_ents)
+    guessed_by_type = Counter(p['type'] for p in pred_ents)
+    gold_by_type = Counter(g['type'] for g in gold_ents)
+    entities = set()
+    for g in gold_ents:
+        entities.add(g['type'])
+
+    def prf(correct, guessed, gold):
+        prec = correct / guessed if guessed > 0 else 0.0
+        rec = correct / gold if gold > 0 else 0.0
+        f = 2.0 * prec * rec / (prec + rec) if prec + rec > 0 else 0.0
+        return prec, rec, f
+
+    prec_micro, rec_micro, f_micro = prf(sum(correct_by_type.values()), sum(guessed_by_type.values()),
+                                         sum(gold_by_type.values()))
+    logger.info("Prec.\tRec.\tF1")
+    logger.info("{:.2f}\t{:.2f}\t{:.2f}".format(prec_micro * 100, rec_micro * 100, f_micro * 100))
+    logger.info("Entity\tPrec.\tRec.\tF1")
+    for entity in entities:
+        prec_ent, rec_ent, f_ent = prf(correct_by_type[entity], guessed_by_type[entity], gold_by_type[entity])
+        logger.info("{}\t{:.2f}\t{:.2f}\t{:.2f}".format(entity, prec_ent * 100, rec_ent * 100, f_ent * 100))
+    return prec_micro, rec_micro, f_micro, fp, fn
+
+
+def random_tags(rng, n_tokens):
+    return [rng.choice(['O', 'O', 'O', 'B-NAME', 'I-NAME', 'B-DATE', 'I-DATE', 'B-PHONE']) for _ in range(n_tokens)]
+
+
+# the gold tags with some of the tags changed
+def noisy_tags(rng, tags):
+    return [rng.choice(['O', 'B-NAME', 'I-DATE']) if rng.random() < 0.2 else tag for tag in tags]
+
+
+class ScorerTest(unittest.TestCase):
+    def assert_same_scores(self, pred, gold):
+        with self.assertLogs(PACKAGE_NAME, 'INFO') as expected_logs:
+            expected = score_by_entity_lists(pred, gold)
+        with self.assertLogs(PACKAGE_NAME, 'INFO') as logs:
+            scores = score_by_entity(pred, gold)
+        self.assertEqual(scores, expected)
+        self.assertEqual(logs.output, expected_logs.output)
+
+    def test_same_as_list_matching(self):
+        rng = random.Random(2020)
+        for _ in range(20):
+            gold = [random_tags(rng, rng.randint(0, 20)) for _ in range(50)]
+            pred = [noisy_tags(rng, tags) for tags in gold]
+            self.assert_same_scores(pred, gold)
+
+    def test_no_entities(self):
+        self.assert_same_scores([['O', 'O'], []], [['O', 'O'], []])
+        self.assertEqual(score_by_entity([['O']], [['O']], verbose=False), (0.0, 0.0, 0.0, [], []))
+
+    def test_fp_and_fn(self):
+        gold = [['B-NAME', 'I-NAME', 'O'], ['B-DATE']]
+        pred = [['B-NAME', 'O', 'O'], ['B-DATE']]
+        precision, recall, f1, fp, fn = score_by_entity(pred, gold, verbose=False)
+        self.assertEqual((precision, recall, f1), (0.5, 0.5, 0.5))
+        self.assertEqual(fp, [{'start': 0, 'end': 0, 'type': 'NAME', 'sent_id': 0}])
+        self.assertEqual(fn, [{'start': 0, 'end': 1, 'type': 'NAME', 'sent_id': 0}])
+
+    def test_different_number_of_sequences(self):
+        with self.assertRaises(AssertionError):
+            score_by_entity([['O']], [['O'], ['O']])
@@ -0,0 +1,75 @@
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from cdeid.models import spacy_trainer
+from cdeid.models.spacy_trainer import SpacyTrainer
+
+
+def save_iteration(run_dir, i, ents_f):
+    iteration_dir = Path(run_dir) / 'model{}'.format(i)
+    iteration_dir.mkdir(parents=True)
+    (iteration_dir / 'meta.json').write_text('{}')
+    (iteration_dir / 'accuracy.json').write_text(json.dumps({'ents_f': ents_f, 'ents_p': 0.0, 'ents_r': 0.0}))
+
+
+class SpacyTrainerResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workspace)
+        self.runs_dir = Path(self.workspace) / 'models' / 'balanced' / 'spacy_runs'
+        self.trainer_calls = []
+        patchers = [mock.patch.object(spacy_trainer, 'spacy_cli', mock.Mock(train=self.fake_train)),
+                    mock.patch.object(SpacyTrainer, 'convert_data'),
+                    mock.patch.object(SpacyTrainer, 'customize_base_mode', return_value='base')]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    # spacy train saving n_iter iterations, with the scores of self.scores
+    def fake_train(self, lang, run_dir, train_file, dev_file, base_model, pipeline, n_iter):
+        self.trainer_calls.append((run_dir.name, base_model, n_iter))
+        for i in range(n_iter):
+            save_iteration(run_dir, i, self.scores.pop(0))
+
+    def test_iterations_in_training_order(self):
+        for i in range(11):
+            save_iteration(self.runs_dir / 'run0', i, 0.1)
+        save_iteration(self.runs_dir / 'run1', 0, 0.2)
+        (self.runs_dir / 'run1' / 'model1').mkdir()
+        iterations = SpacyTrainer(self.workspace, [], 'train.bio', 'dev.bio').iterations(self.runs_dir)
+        self.assertEqual([path.relative_to(self.runs_dir).as_posix() for path in iterations],
+                         ['run0/model{}'.format(i) for i in range(11)] + ['run1/model0'])
+
+    def test_resume_continues_and_selects_best_of_all_runs(self):
+        save_iteration(self.runs_dir / 'run0', 0, 0.5)
+        save_iteration(self.runs_dir / 'run0', 1, 0.9)
+        save_iteration(self.runs_dir / 'run0', 2, 0.4)
+        self.scores = [0.6, 0.7]
+        SpacyTrainer(self.workspace, [], 'train.bio', 'dev.bio', resume=True).train(n_iter=5)
+
+        self.assertEqual(self.trainer_calls, [('run1', str(self.runs_dir / 'run0' / 'model2'), 2)])
+        best = json.loads((self.runs_dir.parent / 'model-best' / 'accuracy.json').read_text())
+        self.assertEqual(best['ents_f'], 0.9)
+        self.assertFalse(self.runs_dir.exists())
+
+    def test_new_training_ignores_previous_iterations(self):
+        for i in range(5):
+            save_iteration(self.runs_dir / 'run0', i, 0.9)
+        self.scores = [0.1, 0.2, 0.3]
+        SpacyTrainer(self.workspace, [], 'train.bio', 'dev.bio').train(n_iter=3)
+
+        self.assertEqual(self.trainer_calls, [('run0', 'base', 3)])
+        best = json.loads((self.runs_dir.parent / 'model-best' / 'accuracy.json').read_text())
+        self.assertEqual(best['ents_f'], 0.3)
+
+    def test_resume_completed_training_trains_nothing(self):
+        for i in range(3):
+            save_iteration(self.runs_dir / 'run0', i, 0.1 * i)
+        SpacyTrainer(self.workspace, [], 'train.bio', 'dev.bio', resume=True).train(n_iter=3)
+        self.assertEqual(self.trainer_calls, [])
+        self.assertAlmostEqual(json.loads((self.runs_dir.parent / 'model-best' / 'accuracy.json')
+                                          .read_text())['ents_f'], 0.2)
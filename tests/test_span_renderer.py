@@ -0,0 +1,66 @@
+import random
+import unittest
+from types import SimpleNamespace
+
+from cdeid.deidentifier.annotator import annotate_sent, surrogate_replacer
+from cdeid.display.html_generator import HTML_TAG_1, HTML_TAG_2, HTML_TAG_3, HTML_TAG_4, add_html_tags_of_entities
+from cdeid.utils.span_renderer import render_spans
+
+
+# the previous annotate_sent, copying the text once per entity
+def annotate_sent_copying(sent):
+    tmp_text = sent.text
+    offset = 0
+    for entity in sent.entities:
+        tmp_text = tmp_text[:entity[0] + offset] + '<**' + entity[2] + '**>' + tmp_text[entity[1] + offset:]
+        offset += (len(entity[2]) + 6 - (entity[1] - entity[0]))
+    return tmp_text
+
+
+# the previous add_html_tags_of_entities
+def add_html_tags_copying(text, entities):
+    offset = 0
+    for entity in entities:
+        tag_before = HTML_TAG_1 + entity[2].lower() + HTML_TAG_2
+        tag_after = HTML_TAG_3 + entity[2].upper() + HTML_TAG_4
+        text = text[:(entity[0] + offset)] \
+            + tag_before + text[(entity[0] + offset):(entity[1] + offset)] \
+            + tag_after + text[(entity[1] + offset):]
+        offset += (len(tag_before) + len(tag_after))
+    return text
+
+
+# a line of words and the sorted entities (start_idx, end_idx, type) over some of them
+def random_line(rng, n_words, entity_rate):
+    words = [''.join(rng.choice('abcdefgh') for _ in range(rng.randint(1, 8))) for _ in range(n_words)]
+    entities = []
+    start = 0
+    for word in words:
+        if rng.random() < entity_rate:
+            entities.append((start, start + len(word), rng.choice(['NAME', 'DATE', 'PHONE'])))
+        start += len(word) + 1
+    return ' '.join(words), entities
+
+
+class SpanRendererTest(unittest.TestCase):
+    def test_same_as_copying(self):
+        rng = random.Random(2020)
+        for _ in range(200):
+            text, entities = random_line(rng, rng.randint(0, 50), rng.choice([0.1, 0.5, 1.0]))
+            sent = SimpleNamespace(text=text, entities=entities)
+            self.assertEqual(annotate_sent(sent), annotate_sent_copying(sent))
+            self.assertEqual(add_html_tags_of_entities(text, entities), add_html_tags_copying(text, entities))
+
+    def test_unsorted_entities(self):
+        text = 'John Smith seen on 2020-01-01'
+        entities = [(19, 29, 'DATE'), (0, 10, 'NAME')]
+        self.assertEqual(render_spans(text, entities, lambda words, entity_type: '[' + entity_type + ']'),
+                         '[NAME] seen on [DATE]')
+
+    def test_surrogates(self):
+        sent = SimpleNamespace(text='John Smith seen on 2020-01-01', entities=[(0, 10, 'NAME'), (19, 29, 'DATE')])
+        self.assertEqual(annotate_sent(sent, surrogate_replacer({'NAME': 'Jane Doe'})), 'Jane Doe seen on <**DATE**>')
+
+    def test_no_entities(self):
+        self.assertEqual(render_spans('seen today', [], None), 'seen today')
+        self.assertEqual(render_spans('', [], None), '')
@@ -0,0 +1,13 @@
+import importlib.util
+import unittest
+
+
+@unittest.skipUnless(importlib.util.find_spec('stanza'), 'stanza is not installed')
+class CheckpointIntervalTest(unittest.TestCase):
+    def test_checkpoint_interval(self):
+        from cdeid.models.stanza_trainer_agent import parse_args
+
+        self.assertEqual(parse_args(['--checkpoint_interval', '0']).checkpoint_interval, 0)
+        self.assertEqual(parse_args([]).checkpoint_interval, 500)
+        with self.assertRaises(SystemExit):
+            parse_args(['--checkpoint_interval', '-1'])
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from cdeid.models.trainer import TRAIN_STEPS, Trainer, THREAD_ENV_VARS
+
+
+# the training steps record the thread limits of their process. The step in fail_method fails
+class FakeTrainer(Trainer):
+    def __init__(self, workspace, n_jobs, threads_per_job, fail_method=None, seconds=1):
+        self.workspace = workspace
+        self.n_jobs = n_jobs
+        self.threads_per_job = threads_per_job
+        self.fail_method = fail_method
+        self.seconds = seconds
+
+    def record(self, method):
+        if method == self.fail_method:
+            raise Exception('training failed')
+        if method != 'prepare_datasets':
+            time.sleep(self.seconds)
+        (Path(self.workspace) / method).write_text(','.join(os.environ.get(name, '') for name in THREAD_ENV_VARS))
+
+    def prepare_datasets(self):
+        self.record('prepare_datasets')
+
+    def train_spacy_balanced(self):
+        self.record('train_spacy_balanced')
+
+    def train_stanza_balanced(self):
+        self.record('train_stanza_balanced')
+
+    def train_flair_balanced(self):
+        self.record('train_flair_balanced')
+
+    def train_spacy_imbalanced(self):
+        self.record('train_spacy_imbalanced')
+
+    def train_stanza_imbalanced(self):
+        self.record('train_stanza_imbalanced')
+
+    def train_flair_imbalanced(self):
+        self.record('train_flair_imbalanced')
+
+    def ensemble_models(self):
+        self.record('ensemble_models')
+
+
+class RunStepsParallelTest(unittest.TestCase):
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workspace)
+        (Path(self.workspace) / '.steps').mkdir()
+
+    def markers(self):
+        return sorted(path.name for path in (Path(self.workspace) / '.steps').iterdir())
+
+    def ran(self, method):
+        return (Path(self.workspace) / method).exists()
+
+    def test_all_steps(self):
+        done = set()
+        FakeTrainer(self.workspace, n_jobs=3, threads_per_job=None, seconds=0).run_steps_parallel(done)
+        self.assertEqual(done, set(TRAIN_STEPS))
+        self.assertTrue(all(self.ran(method) for method, _ in TRAIN_STEPS.values()))
+
+    def test_running_steps_marked_after_failure(self):
+        trainer = FakeTrainer(self.workspace, n_jobs=3, threads_per_job=2, fail_method='train_spacy_balanced')
+        environ = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+        done = set()
+        with self.assertRaisesRegex(Exception, 'training failed'):
+            trainer.run_steps_parallel(done)
+
+        self.assertEqual(done, {1, 3, 4})
+        self.assertEqual(self.markers(), ['1.done', '3.done', '4.done'])
+        # the thread limits are set in the training processes and restored in this process
+        self.assertEqual((Path(self.workspace) / 'train_flair_balanced').read_text(), '2,2,2')
+        self.assertEqual({name: os.environ.get(name) for name in THREAD_ENV_VARS}, environ)
+
+    def test_queued_steps_not_run_after_failure(self):
+        trainer = FakeTrainer(self.workspace, n_jobs=2, threads_per_job=None, fail_method='train_spacy_balanced')
+        done = set()
+        with self.assertRaisesRegex(Exception, 'training failed'):
+            trainer.run_steps_parallel(done)
+
+        self.assertEqual(done, {1, 3})
+        self.assertEqual(self.markers(), ['1.done', '3.done'])
+        for method in ['train_flair_balanced', 'train_spacy_imbalanced', 'train_stanza_imbalanced',
+                       'train_flair_imbalanced', 'ensemble_models']:
+            self.assertFalse(self.ran(method), method)